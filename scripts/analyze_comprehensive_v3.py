@@ -8,19 +8,29 @@
 import sys
 import os
 import argparse
+import warnings
 from pathlib import Path
 from datetime import datetime
 from collections import defaultdict
-import json
+from heapq import nsmallest
+from itertools import islice
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
 
 # 添加utils目录到路径
 sys.path.insert(0, str(Path(__file__).parent.parent / 'utils'))
 
 from utils_data_analysis import (
-    read_excel_data, find_metric, get_metric_value,
+    read_many_excel_data, find_metric, get_metric_value, register_metrics_dict, clear_metric_cache,
+    get_metric_priority_list,
     check_excel_structure, diagnose_missing_data
 )
 
+# 衍生指标循环中频繁使用的NumPy函数（预先绑定，省去属性查找；缺失值为NaN，均使用nan版本）
+_nanmean, _nanmedian, _nanstd = np.nanmean, np.nanmedian, np.nanstd
+
 # ============================================================================
 # 配置部分
 # ============================================================================
@@ -37,10 +47,17 @@ def get_data_files(input_dir):
     """
     base_dir = Path(input_dir)
     files = {}
+    if not base_dir.is_dir():
+        return files
+    
+    # 一次目录扫描取得所有数据文件名，之后只做集合查询（代替逐个 exists() 探测）
+    with os.scandir(base_dir) as entries:
+        present = {entry.name for entry in entries
+                   if entry.name.startswith('results-') and entry.name.endswith('.xls')}
     
     # 首先检查 ir00（初始回合）
     ir00_path = base_dir / 'results-ir00.xls'
-    if ir00_path.exists():
+    if ir00_path.name in present:
         files['ir00'] = ir00_path
     
     # 自动检测 pr01, pr02, pr03, pr04, pr05... 等回合文件
@@ -49,13 +66,13 @@ def get_data_files(input_dir):
     for i in range(1, 100):
         round_name = f'pr{i:02d}'
         file_path = base_dir / f'results-{round_name}.xls'
-        if file_path.exists():
+        if file_path.name in present:
             files[round_name] = file_path
     
     # 同时支持 r01, r02, r03... 格式（映射到 pr01, pr02, pr03...）
     for i in range(1, 100):
         r_format_path = base_dir / f'results-r{i:02d}.xls'
-        if r_format_path.exists():
+        if r_format_path.name in present:
             pr_round_name = f'pr{i:02d}'
             # 如果 pr 格式的文件不存在，则使用 r 格式的文件
             if pr_round_name not in files:
@@ -64,6 +81,11 @@ def get_data_files(input_dir):
     return files
 
 
+def get_prev_round_map(rounds):
+    """返回 {回合: 上一回合} 映射（首回合没有上一回合）"""
+    return dict(zip(rounds[1:], rounds))
+
+
 def get_rounds_order(all_rounds_data=None):
     """
     生成回合顺序列表（用于排序和遍历）
@@ -99,33 +121,68 @@ THRESHOLDS = {
 # ============================================================================
 
 def normalize_team_names(teams):
-    """队伍名称标准化"""
-    return [TEAM_NAME_MAPPING.get(team, team) for team in teams]
+    """队伍名称标准化，返回元组（队伍列表在整个分析过程中不再变化）"""
+    mapping_get = TEAM_NAME_MAPPING.get
+    return tuple(mapping_get(team, team) for team in teams)
+
+
+def value_or_zero(value):
+    """缺失值（None）按0处理，其余数值原样返回"""
+    return value if value is not None else 0.0
+
+
+# EBITDA优先级列表（优先匹配全局汇总金额，避免匹配到百分比值或区域值）
+EBITDA_PRIORITY_LIST = ('息税折旧及摊销前利润(EBITDA)', '息税折旧及摊销前利润', 'EBITDA')
+
+# SoA指标表规格：表名 -> get_metric_value 的查询参数（字符串或优先级列表）
+METRIC_TABLE_SPEC = {
+    '销售额': get_metric_priority_list('销售额'),
+    '净利润': get_metric_priority_list('净利润'),
+    '现金': get_metric_priority_list('现金'),
+    '权益合计': '权益合计',
+    '短期贷款': '短期贷款',
+    '长期贷款': '长期贷款',
+    '总资产': '总资产',
+    '研发': '研发',
+    '广告': '广告',
+    'EBITDA': EBITDA_PRIORITY_LIST,
+}
 
 
-def get_metric_priority_list(metric_name):
+def build_metric_tables(all_rounds_data, teams, rounds=None, metric_spec=None):
     """
-    根据标准指标名称返回优先级列表
-    用于指标提取时的优先级匹配
-    优先匹配全局汇总值，避免匹配到区域性的值
+    一次性解析所有回合、所有队伍的常用指标，构建SoA结构的指标表
+    
+    Returns:
+        {表名: shape=(回合数, 队伍数) 的float64数组}，缺失值为NaN
     """
-    metric_priorities = {
-        '销售额': ['销售额合计', '本地销售额', '当地销售额', '销售额'],
-        '净利润': ['本回合利润', '税后利润', '净利润'],
-        '现金': ['现金及等价物', '现金 31.12.', '现金 1.1.', '现金'],
-        '短期贷款': ['短期贷款（无计划）', '短期贷款'],
-        '长期贷款': ['长期贷款'],
-        '负债合计': ['负债总计', '负债合计'],  # 优先使用负债总计（全局），避免匹配到区域性的负值
-        '总资产': ['总资产'],  # 优先匹配全局汇总的总资产（在"资产负债表, 千 USD, 全球"部分）
-        'EBITDA': ['息税折旧及摊销前利润(EBITDA)'],  # 优先匹配全局汇总的EBITDA
-    }
-    return metric_priorities.get(metric_name, [metric_name])
+    if rounds is None:
+        rounds = get_rounds_order(all_rounds_data)
+    if metric_spec is None:
+        metric_spec = METRIC_TABLE_SPEC
+    
+    tables = {name: np.full((len(rounds), len(teams)), np.nan) for name in metric_spec}
+    for r_idx, rnd in enumerate(rounds):
+        metrics_dict = all_rounds_data[rnd]
+        for name, lookup in metric_spec.items():
+            row = tables[name][r_idx]
+            for t_idx, team in enumerate(teams):
+                val = get_metric_value(metrics_dict, lookup, team)
+                if val is not None:
+                    row[t_idx] = val
+    return tables
+
 
+def build_round_tables(metrics_dict, teams, metric_spec=None):
+    """单回合版本的 build_metric_tables，返回 {表名: shape=(队伍数,) 数组}"""
+    tables = build_metric_tables({'_': metrics_dict}, teams, ['_'], metric_spec)
+    return {name: table[0] for name, table in tables.items()}
 
-def get_metric_with_priority(metrics_dict, metric_name, team):
-    """使用优先级列表获取指标值"""
-    priority_list = get_metric_priority_list(metric_name)
-    return get_metric_value(metrics_dict, priority_list, team)
+
+def descending_order(values):
+    """返回非NaN元素按数值降序排列的下标（数值相同时保持原有顺序），用于计算排名"""
+    valid_idx = np.flatnonzero(~np.isnan(values))
+    return valid_idx[np.argsort(-values[valid_idx], kind='stable')]
 
 
 def validate_data_integrity(metrics_dict, teams):
@@ -146,7 +203,7 @@ def validate_data_integrity(metrics_dict, teams):
         # 也可以使用"股东权益和负债总计"来验证
         total_equity_liability = None
         for key, metric_data in metrics_dict.items():
-            if '股东权益和负债总计' in str(key) and '全球' in str(key):
+            if '股东权益和负债总计' in key and '全球' in key:
                 if team in metric_data:
                     total_equity_liability = metric_data.get(team)
                     break
@@ -184,118 +241,127 @@ def validate_data_integrity(metrics_dict, teams):
     return issues
 
 
-def detect_anomalies(metrics_dict, teams):
-    """异常值检测"""
-    anomalies = defaultdict(list)
+def detect_anomalies(metrics_dict, teams, tables=None):
+    """异常值检测
     
-    for team in teams:
-        # 现金极端值
-        cash = get_metric_with_priority(metrics_dict, '现金', team)
-        if cash:
-            if cash > 1500000 or cash < 5000:
-                anomalies[team].append({
-                    'type': '现金极端值',
-                    'value': cash,
-                    'rule': '>$1.5M或<$5k'
-                })
-        
-        # 负权益
-        equity = get_metric_value(metrics_dict, '权益合计', team)
-        if equity and equity < 0:
+    tables: 该回合的指标数组（build_round_tables 的结果），为None时从metrics_dict构建
+    """
+    if tables is None:
+        tables = build_round_tables(metrics_dict, teams)
+    
+    cash = tables['现金']
+    equity = tables['权益合计']
+    # 现金极端值（现金为0或缺失时不检测）
+    cash_mask = (cash != 0) & ((cash > 1500000) | (cash < 5000))
+    # 负权益
+    equity_mask = equity < 0
+    
+    anomalies = defaultdict(list)
+    for i in np.flatnonzero(cash_mask | equity_mask):
+        team = teams[i]
+        if cash_mask[i]:
+            anomalies[team].append({
+                'type': '现金极端值',
+                'value': float(cash[i]),
+                'rule': '>$1.5M或<$5k'
+            })
+        if equity_mask[i]:
             anomalies[team].append({
                 'type': '负权益',
-                'value': equity,
+                'value': float(equity[i]),
                 'rule': '权益合计<0'
             })
     
     return anomalies
 
 
-def calculate_derived_metrics(all_rounds_data, teams):
-    """计算衍生指标"""
+def _round_stats(mat):
+    """
+    对 (回合数, 队伍数) 指标矩阵按行一次性计算统计量
+    
+    Returns:
+        mean, median, std: 每回合的行业均值/中位数/标准差（NaN不参与统计，整行缺失时为NaN）
+        order: 每回合按数值降序排列的队伍下标（数值相同时保持原有顺序，NaN排在最后）
+        n_valid: 每回合的有效（非NaN）队伍数
+    """
+    missing = np.isnan(mat)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # 整行缺失时的空切片警告
+        mean = _nanmean(mat, axis=1)
+        median = _nanmedian(mat, axis=1)
+        std = _nanstd(mat, axis=1)
+    order = np.argsort(np.where(missing, np.inf, -mat), axis=1, kind='stable')
+    n_valid = (~missing).sum(axis=1)
+    return mean, median, std, order, n_valid
+
+
+def calculate_derived_metrics(all_rounds_data, teams, tables=None):
+    """计算衍生指标
+    
+    行业统计量和排名顺序按指标对整个 (回合, 队伍) 矩阵一次性计算；
+    每个回合再基于同一份指标数组计算环比增长率、排名变化、战略偏离度
+    
+    tables: build_metric_tables 生成的指标表，为None时自动构建
+    """
     derived = {}
     rounds = get_rounds_order(all_rounds_data)
+    if tables is None:
+        tables = build_metric_tables(all_rounds_data, teams, rounds)
     
-    for rnd in rounds:
-        if rnd not in all_rounds_data:
-            continue
-        
-        metrics_dict = all_rounds_data[rnd]
-        derived[rnd] = {}
+    metric_names = ['销售额', '净利润', '现金', '权益合计']
+    stats = {name: _round_stats(tables[name]) for name in metric_names}
+    
+    prev_derived = {}
+    for r_idx, rnd in enumerate(rounds):
+        current = derived[rnd] = {}
         
-        # 计算行业统计量
-        for metric_name in ['销售额', '净利润', '现金', '权益合计']:
-            values = []
-            for team in teams:
-                val = get_metric_with_priority(metrics_dict, metric_name, team)
-                if val is not None:
-                    values.append(val)
+        for metric_name in metric_names:
+            mean, median, std, order, n_valid = stats[metric_name]
+            if not n_valid[r_idx]:
+                continue
+            values = tables[metric_name][r_idx]
             
-            if values:
-                import numpy as np
-                derived[rnd][f'{metric_name}_行业均值'] = np.mean(values)
-                derived[rnd][f'{metric_name}_行业中位数'] = np.median(values)
-                derived[rnd][f'{metric_name}_行业标准差'] = np.std(values)
-        
-        # 计算排名
-        for metric_name in ['销售额', '净利润', '现金']:
-            team_values = {}
-            for team in teams:
-                val = get_metric_with_priority(metrics_dict, metric_name, team)
-                if val is not None:
-                    team_values[team] = val
+            # 行业统计量（NaN表示缺失值，不参与统计）
+            industry_mean = mean[r_idx]
+            current[f'{metric_name}_行业均值'] = industry_mean
+            current[f'{metric_name}_行业中位数'] = median[r_idx]
+            current[f'{metric_name}_行业标准差'] = std[r_idx]
             
-            if team_values:
-                sorted_teams = sorted(team_values.items(), key=lambda x: x[1], reverse=True)
-                rankings = {team: rank+1 for rank, (team, _) in enumerate(sorted_teams)}
-                derived[rnd][f'{metric_name}_排名'] = rankings
-        
-        # 计算环比增长率（需要上回合数据）
-        if rnd != 'ir00':
-            prev_rnd = rounds[rounds.index(rnd) - 1]
-            if prev_rnd in all_rounds_data:
-                prev_metrics = all_rounds_data[prev_rnd]
-                for metric_name in ['销售额', '净利润', '现金']:
-                    growth_rates = {}
+            if metric_name == '权益合计':
+                continue  # 权益合计只需要行业统计量
+            
+            # 排名
+            valid_idx = order[r_idx, :n_valid[r_idx]]
+            rankings = {teams[i]: rank for rank, i in enumerate(valid_idx, 1)}
+            current[f'{metric_name}_排名'] = rankings
+            
+            # 环比增长率和排名变化（需要上回合数据）
+            if r_idx > 0:
+                previous = tables[metric_name][r_idx - 1]
+                growth_valid = ~np.isnan(values) & ~np.isnan(previous) & (previous != 0)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    rates = ((values - previous) / np.abs(previous)) * 100
+                growth_rates = {teams[i]: float(rates[i]) for i in np.flatnonzero(growth_valid)}
+                if growth_rates:
+                    current[f'{metric_name}_环比增长'] = growth_rates
+                
+                previous_rankings = prev_derived.get(f'{metric_name}_排名', {})
+                if previous_rankings:
+                    rank_changes = {}
                     for team in teams:
-                        current = get_metric_with_priority(metrics_dict, metric_name, team)
-                        previous = get_metric_with_priority(prev_metrics, metric_name, team)
-                        if current is not None and previous is not None and previous != 0:
-                            growth_rate = ((current - previous) / abs(previous)) * 100
-                            growth_rates[team] = growth_rate
-                    if growth_rates:
-                        derived[rnd][f'{metric_name}_环比增长'] = growth_rates
-        
-        # 计算排名变化（需要上回合数据）
-        if rnd != 'ir00':
-            prev_rnd = rounds[rounds.index(rnd) - 1]
-            if prev_rnd in all_rounds_data:
-                prev_derived = derived.get(prev_rnd, {})
-                for metric_name in ['销售额', '净利润', '现金']:
-                    current_rankings = derived[rnd].get(f'{metric_name}_排名', {})
-                    previous_rankings = prev_derived.get(f'{metric_name}_排名', {})
-                    if current_rankings and previous_rankings:
-                        rank_changes = {}
-                        for team in teams:
-                            current_rank = current_rankings.get(team)
-                            previous_rank = previous_rankings.get(team)
-                            if current_rank is not None and previous_rank is not None:
-                                rank_changes[team] = current_rank - previous_rank
-                        if rank_changes:
-                            derived[rnd][f'{metric_name}_排名变化'] = rank_changes
+                        current_rank = rankings.get(team)
+                        previous_rank = previous_rankings.get(team)
+                        if current_rank is not None and previous_rank is not None:
+                            rank_changes[team] = current_rank - previous_rank
+                    if rank_changes:
+                        current[f'{metric_name}_排名变化'] = rank_changes
+            
+            # 战略偏离度（自身指标与行业均值的偏离程度）
+            if industry_mean != 0:
+                deviation = np.abs(values - industry_mean) / abs(industry_mean) * 100
+                current[f'{metric_name}_战略偏离度'] = {teams[i]: float(deviation[i]) for i in np.sort(valid_idx)}
         
-        # 计算战略偏离度（自身指标与行业均值的偏离程度）
-        for metric_name in ['销售额', '净利润', '现金']:
-            industry_mean = derived[rnd].get(f'{metric_name}_行业均值')
-            if industry_mean is not None and industry_mean != 0:
-                deviations = {}
-                for team in teams:
-                    team_value = get_metric_with_priority(metrics_dict, metric_name, team)
-                    if team_value is not None:
-                        deviation = abs(team_value - industry_mean) / abs(industry_mean) * 100
-                        deviations[team] = deviation
-                if deviations:
-                    derived[rnd][f'{metric_name}_战略偏离度'] = deviations
+        prev_derived = current
     
     return derived
 
@@ -304,152 +370,137 @@ def calculate_derived_metrics(all_rounds_data, teams):
 # 第三章：自身诊断分析
 # ============================================================================
 
-def calculate_financial_health(metrics_dict, teams):
-    """财务健康度红绿灯系统"""
-    health = {}
+# 红绿灯状态码及其显示符号（内部只保存状态码，生成报告时再转换为符号）
+RED, YELLOW, GREEN = 0, 1, 2
+TRAFFIC_LIGHT_EMOJI = ('🔴', '🟡', '🟢')
+
+
+# 财务健康度指标（报告中的列顺序）
+HEALTH_INDICATORS = ('现金储备', '净债务权益比', 'EBITDA率', '权益比率', '研发回报率')
+
+
+def format_status(code):
+    """将红绿灯状态码转换为显示符号（无状态时返回N/A）"""
+    return 'N/A' if code is None else TRAFFIC_LIGHT_EMOJI[code]
+
+
+def _classify_traffic_light(values, threshold, higher_is_better=True):
+    """按阈值对指标数组分级，返回状态码数组（NaN 归为 RED）"""
+    green, yellow = threshold['green'], threshold['yellow']
+    if higher_is_better:
+        conditions = [values > green, values >= yellow]
+    else:
+        conditions = [values < green, values <= yellow]
+    return np.select(conditions, [GREEN, YELLOW], default=RED)
+
+
+def calculate_financial_health(metrics_dict, teams, tables=None):
+    """财务健康度红绿灯系统
     
-    for team in teams:
+    tables: 该回合的指标数组（build_round_tables 的结果），为None时从metrics_dict构建
+    """
+    if tables is None:
+        tables = build_round_tables(metrics_dict, teams)
+    
+    def filled(name):
+        values = tables[name]
+        return np.where(np.isnan(values), 0.0, values)
+    
+    cash = filled('现金')
+    equity = filled('权益合计')
+    short_debt = filled('短期贷款')
+    long_debt = filled('长期贷款')
+    sales = filled('销售额')
+    assets = filled('总资产')
+    profit = filled('净利润')
+    rd_expense = filled('研发')
+    # EBITDA值太小（<100）可能是百分比，按0处理
+    ebitda = tables['EBITDA']
+    ebitda = np.where(np.isnan(ebitda) | (np.abs(ebitda) < 100), 0.0, ebitda)
+    
+    # 指标计算（无法计算的位置为NaN）
+    with np.errstate(divide='ignore', invalid='ignore'):
+        indicators = {
+            # 1. 现金储备
+            '现金储备': cash,
+            # 2. 净债务/权益比
+            '净债务权益比': np.where(equity > 0, (((short_debt + long_debt) - cash) / equity) * 100, np.nan),
+            # 3. EBITDA率
+            'EBITDA率': np.where(sales > 0, (ebitda / sales) * 100, np.nan),
+            # 4. 权益比率
+            '权益比率': np.where((assets > 0) & (equity > 0), (equity / assets) * 100, np.nan),
+            # 5. 研发回报率
+            '研发回报率': np.where(rd_expense > 0, (profit / rd_expense) * 100, np.nan),
+        }
+    
+    # 红绿灯分级；无法计算时研发回报率为黄灯（无研发投入），其余为红灯
+    statuses = {
+        '现金储备': _classify_traffic_light(cash, THRESHOLDS['现金储备']),
+        '净债务权益比': _classify_traffic_light(indicators['净债务权益比'], THRESHOLDS['净债务权益比'],
+                                          higher_is_better=False),
+        'EBITDA率': _classify_traffic_light(indicators['EBITDA率'], THRESHOLDS['EBITDA率']),
+        '权益比率': _classify_traffic_light(indicators['权益比率'], THRESHOLDS['权益比率']),
+        '研发回报率': np.where(np.isnan(indicators['研发回报率']), YELLOW,
+                           _classify_traffic_light(indicators['研发回报率'], THRESHOLDS['研发回报率'])),
+    }
+    
+    # 指标表与状态码表：行为队伍，列为指标
+    indicators_df = pd.DataFrame(indicators, index=teams)
+    status_df = pd.DataFrame(statuses, index=teams)
+    
+    # 根据红黄灯数量生成行动建议（按顺序取第一个满足的条件）
+    red_counts = (status_df == RED).sum(axis=1)
+    yellow_counts = (status_df == YELLOW).sum(axis=1)
+    actions = np.select(
+        [red_counts > 2, (yellow_counts > 3) | (red_counts > 0), (red_counts == 0) & (yellow_counts <= 1)],
+        ['⚠️ 立即进入生存模式（停止投资、削减成本）', '⚠️ 召开紧急战略复盘会', '✅ 可考虑激进扩张'],
+        default=''
+    )
+    
+    # 转换为按队伍组织的嵌套字典（无法计算的指标为None）
+    indicator_records = indicators_df.astype(object).where(indicators_df.notna(), None).to_dict('index')
+    status_records = status_df.to_dict('index')
+    
+    health = {}
+    for team, action, red_count in zip(teams, actions.tolist(), red_counts.tolist()):
         health[team] = {
-            'indicators': {},
-            'status': {},
-            'action_required': []
+            'indicators': indicator_records[team],
+            'status': status_records[team],
+            'red_count': red_count,  # 红灯数量（供报告、检查清单直接使用）
+            'action_required': [action] if action else []
         }
-        
-        # 1. 现金储备
-        cash = get_metric_with_priority(metrics_dict, '现金', team) or 0
-        if cash > THRESHOLDS['现金储备']['green']:
-            status = '🟢'
-        elif cash >= THRESHOLDS['现金储备']['yellow']:
-            status = '🟡'
-        else:
-            status = '🔴'
-        
-        health[team]['indicators']['现金储备'] = cash
-        health[team]['status']['现金储备'] = status
-        
-        # 2. 净债务/权益比
-        equity = get_metric_value(metrics_dict, '权益合计', team) or 0
-        short_debt = get_metric_value(metrics_dict, '短期贷款', team) or 0
-        long_debt = get_metric_value(metrics_dict, '长期贷款', team) or 0
-        
-        if equity > 0:
-            net_debt = (short_debt + long_debt) - cash
-            debt_equity_ratio = (net_debt / equity) * 100
-            
-            if debt_equity_ratio < THRESHOLDS['净债务权益比']['green']:
-                status = '🟢'
-            elif debt_equity_ratio <= THRESHOLDS['净债务权益比']['yellow']:
-                status = '🟡'
-            else:
-                status = '🔴'
-            
-            health[team]['indicators']['净债务权益比'] = debt_equity_ratio
-            health[team]['status']['净债务权益比'] = status
-        else:
-            health[team]['indicators']['净债务权益比'] = None
-            health[team]['status']['净债务权益比'] = '🔴'
-        
-        # 3. EBITDA率
-        # 优先使用全局汇总的EBITDA，避免匹配到百分比值或区域值
-        # 使用优先级列表匹配，确保提取到正确的全局汇总值
-        ebitda = get_metric_value(metrics_dict, ['息税折旧及摊销前利润(EBITDA)', '息税折旧及摊销前利润', 'EBITDA'], team)
-        
-        # 验证提取的EBITDA值是否合理
-        if ebitda is None:
-            ebitda = 0
-        elif abs(ebitda) < 100:
-            # 值太小（<100），可能是百分比，设为0
-            ebitda = 0
-        else:
-            ebitda = ebitda or 0
-        
-        sales = get_metric_with_priority(metrics_dict, '销售额', team) or 0
-        
-        if sales > 0:
-            ebitda_rate = (ebitda / sales) * 100
-            if ebitda_rate > THRESHOLDS['EBITDA率']['green']:
-                status = '🟢'
-            elif ebitda_rate >= THRESHOLDS['EBITDA率']['yellow']:
-                status = '🟡'
-            else:
-                status = '🔴'
-            
-            health[team]['indicators']['EBITDA率'] = ebitda_rate
-            health[team]['status']['EBITDA率'] = status
-        else:
-            health[team]['indicators']['EBITDA率'] = None
-            health[team]['status']['EBITDA率'] = '🔴'
-        
-        # 4. 权益比率
-        assets = get_metric_value(metrics_dict, '总资产', team) or 0
-        if assets > 0 and equity > 0:
-            equity_ratio = (equity / assets) * 100
-            if equity_ratio > THRESHOLDS['权益比率']['green']:
-                status = '🟢'
-            elif equity_ratio >= THRESHOLDS['权益比率']['yellow']:
-                status = '🟡'
-            else:
-                status = '🔴'
-            
-            health[team]['indicators']['权益比率'] = equity_ratio
-            health[team]['status']['权益比率'] = status
-        else:
-            health[team]['indicators']['权益比率'] = None
-            health[team]['status']['权益比率'] = '🔴'
-        
-        # 5. 研发回报率
-        profit = get_metric_with_priority(metrics_dict, '净利润', team) or 0
-        rd_expense = get_metric_value(metrics_dict, '研发', team) or 0
-        
-        if rd_expense and rd_expense > 0 and profit is not None:
-            rd_return = (profit / rd_expense) * 100
-            if rd_return > THRESHOLDS['研发回报率']['green']:
-                status = '🟢'
-            elif rd_return >= THRESHOLDS['研发回报率']['yellow']:
-                status = '🟡'
-            else:
-                status = '🔴'
-            
-            health[team]['indicators']['研发回报率'] = rd_return
-            health[team]['status']['研发回报率'] = status
-        else:
-            health[team]['indicators']['研发回报率'] = None
-            health[team]['status']['研发回报率'] = '🟡'  # 无研发投入
-        
-        # 统计并生成行动建议
-        red_count = sum(1 for s in health[team]['status'].values() if '🔴' in str(s))
-        yellow_count = sum(1 for s in health[team]['status'].values() if '🟡' in str(s))
-        
-        if red_count > 2:
-            health[team]['action_required'].append('⚠️ 立即进入生存模式（停止投资、削减成本）')
-        elif yellow_count > 3 or red_count > 0:
-            health[team]['action_required'].append('⚠️ 召开紧急战略复盘会')
-        elif red_count == 0 and yellow_count <= 1:
-            health[team]['action_required'].append('✅ 可考虑激进扩张')
     
     return health
 
 
-def analyze_cash_flow_source(metrics_dict, teams, prev_metrics_dict):
-    """现金流源头分析"""
-    cash_flow = {}
+def analyze_cash_flow_source(metrics_dict, teams, prev_metrics_dict, tables=None, prev_tables=None):
+    """现金流源头分析
     
-    for team in teams:
-        cash = get_metric_with_priority(metrics_dict, '现金', team) or 0
-        prev_cash = get_metric_with_priority(prev_metrics_dict, '现金', team) or 0 if prev_metrics_dict else 0
-        cash_change = cash - prev_cash
-        
-        # 修复：确保能提取到EBITDA值（优先使用全局汇总，避免百分比值）
-        ebitda = get_metric_value(metrics_dict, ['息税折旧及摊销前利润(EBITDA)', '息税折旧及摊销前利润', 'EBITDA'], team)
-        if ebitda is None or (ebitda is not None and abs(ebitda) < 100):
-            ebitda = 0
-        else:
-            ebitda = ebitda or 0
-        
-        if ebitda > 100000:
+    tables / prev_tables: 本回合 / 上回合的指标数组（build_round_tables 的结果），为None时从数据构建
+    """
+    if tables is None:
+        tables = build_round_tables(metrics_dict, teams)
+    if prev_tables is None and prev_metrics_dict:
+        prev_tables = build_round_tables(prev_metrics_dict, teams)
+    
+    cash = np.nan_to_num(tables['现金'])
+    prev_cash = np.nan_to_num(prev_tables['现金']) if prev_tables is not None else np.zeros(len(teams))
+    cash_change = cash - prev_cash
+    # 修复：确保能提取到EBITDA值（优先使用全局汇总，避免百分比值）
+    ebitda = _filled_ebitda(tables['EBITDA'])
+    
+    cash_type_idx = np.select(
+        [ebitda > 100000, (cash_change > 0) & (np.abs(ebitda) < np.abs(cash_change) * 0.5)],
+        [0, 1], default=2
+    )
+    
+    cash_flow = {}
+    for t_idx, team in enumerate(teams):
+        idx = cash_type_idx[t_idx]
+        if idx == 0:
             cash_type = 'A. 经营驱动型（健康）'
-            description = f'经营现金流+${ebitda/1000:.0f}k → 可扩张'
-        elif cash_change > 0 and abs(ebitda) < abs(cash_change) * 0.5:
+            description = f'经营现金流+${ebitda[t_idx]/1000:.0f}k → 可扩张'
+        elif idx == 1:
             cash_type = 'B. 融资驱动型（危险）'
             description = '融资现金流为主要来源 → 不可持续'
         else:
@@ -457,8 +508,8 @@ def analyze_cash_flow_source(metrics_dict, teams, prev_metrics_dict):
             description = '投资现金流消耗现金 → 关注下回合回报'
         
         cash_flow[team] = {
-            '现金变化': cash_change,
-            '经营现金流(EBITDA)': ebitda,
+            '现金变化': float(cash_change[t_idx]),
+            '经营现金流(EBITDA)': float(ebitda[t_idx]),
             '现金流类型': cash_type,
             '描述': description
         }
@@ -466,101 +517,128 @@ def analyze_cash_flow_source(metrics_dict, teams, prev_metrics_dict):
     return cash_flow
 
 
-def analyze_regional_market(all_rounds_data, teams, round_name):
+def resolve_region_keys(metrics_dict, region):
+    """
+    返回区域销售额的候选指标名中，在metrics_dict里实际存在的那些（保持优先级顺序）
+    优先级：1. 直接区域名 2. "在{region}销售" 3. "{region}销售额"
+    每个回合、每个区域只需解析一次，之后对所有队伍复用
+    """
+    candidates = (region, f'在{region}销售', f'{region}销售额')
+    return [name for name in candidates if any(name in key for key in metrics_dict)]
+
+
+def get_region_sales(metrics_dict, region_keys, team):
+    """按优先级获取区域销售额，返回第一个非零值；均未找到时返回0"""
+    for name in region_keys:
+        sales = get_metric_value(metrics_dict, name, team)
+        if sales is not None and sales != 0:
+            return sales
+    return 0
+
+
+# 区域市场（顺序即区域下标）
+REGIONS = ('美国', '亚洲', '欧洲')
+
+
+def build_region_sales_tensor(all_rounds_data, teams, rounds=None, regions=REGIONS):
+    """
+    构建区域销售额张量
+    
+    Returns:
+        shape=(区域数, 回合数, 队伍数) 的数组，无区域销售额时为0
+    """
+    if rounds is None:
+        rounds = get_rounds_order(all_rounds_data)
+    
+    region_sales = np.zeros((len(regions), len(rounds), len(teams)))
+    for r_idx, rnd in enumerate(rounds):
+        metrics_dict = all_rounds_data[rnd]
+        for g_idx, region in enumerate(regions):
+            region_keys = resolve_region_keys(metrics_dict, region)
+            if region_keys:
+                region_sales[g_idx, r_idx] = [get_region_sales(metrics_dict, region_keys, team) for team in teams]
+    return region_sales
+
+
+def analyze_regional_market(all_rounds_data, teams, round_name, prev_round=None,
+                            sales=None, prev_sales=None):
     """区域市场表现分析（替代方案）
     
     注意：由于Excel中区域销售额数据不可用或数据量极小（仅占总额的0.05%-0.65%），
     区域市场分析功能受限。当前使用"美国"、"亚洲"、"欧洲"指标作为替代，
     但这些指标的实际含义可能与区域销售额不符。
+    
+    prev_round: 上一回合名称（为None时根据回合顺序自动确定）
+    sales / prev_sales: 本回合 / 上回合各区域销售额，shape=(区域数, 队伍数)，
+                        为None时从数据构建（见 build_region_sales_tensor）
     """
     regional_performance = {}
-    regions = ['美国', '亚洲', '欧洲']
-    
-    metrics_dict = all_rounds_data[round_name]
+    regions = REGIONS
     
     # 计算每个区域所有队伍的销售额
     # 修复：区域销售额指标名直接使用区域名（"美国"、"亚洲"、"欧洲"），而不是"在{region}销售"
+    if sales is None:
+        sales = build_region_sales_tensor(all_rounds_data, teams, [round_name], regions)[:, 0]
+    
     region_total_sales = {}
-    for region in regions:
-        total = 0
-        region_sales = {}
-        for team in teams:
-            # 优先级：1. 直接区域名 2. "在{region}销售" 3. "{region}销售额"
-            sales = get_metric_value(metrics_dict, region, team)
-            if sales is None or sales == 0:
-                # 尝试其他命名方式
-                sales = get_metric_value(metrics_dict, f'在{region}销售', team)
-            if sales is None or sales == 0:
-                sales = get_metric_value(metrics_dict, f'{region}销售额', team)
-            
-            # 只统计有销售额的队伍，且销售额必须>0
-            if sales is not None and sales > 0:
-                region_sales[team] = sales
-                total += sales
-        region_total_sales[region] = {'total': total, 'team_sales': region_sales}
+    for g_idx, region in enumerate(regions):
+        all_sales = dict(zip(teams, sales[g_idx].tolist()))
+        # 只统计有销售额的队伍，且销售额必须>0
+        region_sales = {team: value for team, value in all_sales.items() if value > 0}
+        total = sum(region_sales.values())
+        # 一次性计算该区域的销售额排名（只有销售额>0的队伍才排名）
+        sales_values = np.where(sales[g_idx] > 0, sales[g_idx], np.nan)
+        rankings = {teams[i]: rank for rank, i in enumerate(descending_order(sales_values), 1)}
+        region_total_sales[region] = {
+            'total': total,
+            'all_sales': all_sales,
+            'team_sales': region_sales,
+            'rankings': rankings,
+        }
     
     # 计算销售趋势（对比上回合）
-    rounds = get_rounds_order(all_rounds_data)
-    round_idx = rounds.index(round_name) if round_name in rounds else -1
-    prev_round = rounds[round_idx - 1] if round_idx > 0 else None
+    if prev_sales is None:
+        if prev_round is None:
+            prev_round = get_prev_round_map(get_rounds_order(all_rounds_data)).get(round_name)
+        if prev_round and prev_round in all_rounds_data:
+            prev_sales = build_region_sales_tensor(all_rounds_data, teams, [prev_round], regions)[:, 0]
     
-    for team in teams:
+    for t_idx, team in enumerate(teams):
         regional_performance[team] = {}
         
-        for region in regions:
-            # 修复：区域销售额指标名直接使用区域名，优先级匹配
-            sales = get_metric_value(metrics_dict, region, team)
-            if sales is None or sales == 0:
-                sales = get_metric_value(metrics_dict, f'在{region}销售', team)
-            if sales is None or sales == 0:
-                sales = get_metric_value(metrics_dict, f'{region}销售额', team)
-            # 处理None值，统一为0
-            if sales is None:
-                sales = 0
+        for g_idx, region in enumerate(regions):
+            team_sales = region_total_sales[region]['all_sales'][team]
             
             # 计算市场份额（替代方案）
             # 修复：只有销售额>0时才计算市场份额和排名
             market_share = None
             ranking = None
             
-            if sales is not None and sales > 0:
+            if team_sales is not None and team_sales > 0:
                 if region_total_sales[region]['total'] > 0:
-                    market_share = (sales / region_total_sales[region]['total']) * 100
+                    market_share = (team_sales / region_total_sales[region]['total']) * 100
                 
-                # 计算排名（只有销售额>0的队伍才排名）
-                team_sales = region_total_sales[region]['team_sales']
-                if team_sales and sales in team_sales.values():
-                    sorted_teams = sorted(team_sales.items(), key=lambda x: x[1], reverse=True)
-                    for rank, (t, _) in enumerate(sorted_teams, 1):
-                        if t == team:
-                            ranking = rank
-                            break
+                # 排名（只有销售额>0的队伍才排名）
+                ranking = region_total_sales[region]['rankings'].get(team)
             
             # 计算销售趋势（如果数据可用）
             sales_trend = '稳定'
-            if prev_round and prev_round in all_rounds_data:
-                prev_metrics = all_rounds_data[prev_round]
-                prev_sales = get_metric_value(prev_metrics, region, team)
-                if prev_sales is None or prev_sales == 0:
-                    prev_sales = get_metric_value(prev_metrics, f'在{region}销售', team)
-                if prev_sales is None or prev_sales == 0:
-                    prev_sales = get_metric_value(prev_metrics, f'{region}销售额', team)
-                if prev_sales is None:
-                    prev_sales = 0
-                if prev_sales > 0:
-                    growth_rate = ((sales - prev_sales) / prev_sales) * 100
+            if prev_sales is not None:
+                prev_value = prev_sales[g_idx, t_idx]
+                if prev_value > 0:
+                    growth_rate = ((team_sales - prev_value) / prev_value) * 100
                     if growth_rate > 10:
                         sales_trend = '增长'
                     elif growth_rate < -10:
                         sales_trend = '下降'
                     else:
                         sales_trend = '稳定'
-                elif sales > 0:
+                elif team_sales > 0:
                     sales_trend = '新进入'
             
             # 策略建议（考虑排名和趋势）
             suggestions = []
-            if sales > 0:  # 只在有销售额时给出建议
+            if team_sales > 0:  # 只在有销售额时给出建议
                 if ranking and ranking <= 3:
                     if sales_trend == '增长':
                         suggestions.append('巩固优势，考虑提价')
@@ -577,7 +655,7 @@ def analyze_regional_market(all_rounds_data, teams, round_name):
                     suggestions.append('退出或大幅调整策略')
             
             regional_performance[team][region] = {
-                '销售额': sales,
+                '销售额': team_sales,
                 '市场份额': market_share,
                 '排名': ranking,
                 '销售趋势': sales_trend,
@@ -591,228 +669,197 @@ def analyze_regional_market(all_rounds_data, teams, round_name):
 # 第四章：竞争分析解码
 # ============================================================================
 
-def calculate_competitive_position(metrics_dict, teams):
-    """三维度对标矩阵"""
-    competitive_matrix = {}
+STRATEGY_TYPES = ('战略清晰（高投入+高回报）', '策略试错（高投入+低回报）', '市场套利（零研发+高利润）', '稳健经营')
+
+
+def calculate_competitive_position(metrics_dict, teams, tables=None):
+    """三维度对标矩阵
     
-    for team in teams:
-        equity = get_metric_value(metrics_dict, '权益合计', team) or 0
-        short_debt = get_metric_value(metrics_dict, '短期贷款', team) or 0
-        long_debt = get_metric_value(metrics_dict, '长期贷款', team) or 0
-        cash = get_metric_with_priority(metrics_dict, '现金', team) or 0
-        sales = get_metric_with_priority(metrics_dict, '销售额', team) or 0
-        rd_expense = get_metric_value(metrics_dict, '研发', team) or 0
-        ad_expense = get_metric_value(metrics_dict, '广告', team) or 0
-        profit = get_metric_with_priority(metrics_dict, '净利润', team) or 0
-        
-        # 1. 财务激进度
-        if equity > 0:
-            net_debt = (short_debt + long_debt) - cash
-            financial_aggressiveness = (net_debt / equity) * 100
-        else:
-            financial_aggressiveness = 999
-        
+    tables: 该回合的指标数组（build_round_tables 的结果），为None时从metrics_dict构建
+    """
+    if tables is None:
+        tables = build_round_tables(metrics_dict, teams)
+    
+    def filled(name):
+        values = tables[name]
+        return np.where(np.isnan(values), 0.0, values)
+    
+    equity = filled('权益合计')
+    short_debt = filled('短期贷款')
+    long_debt = filled('长期贷款')
+    cash = filled('现金')
+    sales = filled('销售额')
+    rd_expense = filled('研发')
+    ad_expense = filled('广告')
+    profit = filled('净利润')
+    
+    has_sales = sales > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 1. 财务激进度（权益非正时记为999）
+        financial_aggressiveness = np.where(
+            equity > 0, (((short_debt + long_debt) - cash) / equity) * 100, 999.0)
         # 2. 市场侵略性
-        market_aggressiveness = (ad_expense / sales * 100) if sales > 0 else 0
-        
+        market_aggressiveness = np.where(has_sales, ad_expense / sales * 100, 0.0)
         # 3. 技术投入度
-        tech_investment = (rd_expense / sales * 100) if sales > 0 else 0
-        
-        # 策略类型识别
-        strategy_type = '未知'
-        if tech_investment > 20 and rd_expense > 0:
-            ros = (profit / sales * 100) if sales > 0 else 0
-            if ros > 20:
-                strategy_type = '战略清晰（高投入+高回报）'
-            else:
-                strategy_type = '策略试错（高投入+低回报）'
-        elif tech_investment < 1 and profit and profit > 0:
-            strategy_type = '市场套利（零研发+高利润）'
-        elif tech_investment < 5 and market_aggressiveness < 5:
-            strategy_type = '稳健经营'
-        
+        tech_investment = np.where(has_sales, rd_expense / sales * 100, 0.0)
+        ros = np.where(has_sales, profit / sales * 100, 0.0)
+    
+    # 策略类型识别（按顺序取第一个满足的条件）
+    high_tech = (tech_investment > 20) & (rd_expense > 0)
+    conditions = [
+        high_tech & (ros > 20),
+        high_tech,
+        (tech_investment < 1) & (profit > 0),
+        (tech_investment < 5) & (market_aggressiveness < 5),
+    ]
+    strategy_idx = np.select(conditions, range(len(STRATEGY_TYPES)), default=-1)
+    
+    competitive_matrix = {}
+    for t_idx, team in enumerate(teams):
+        idx = strategy_idx[t_idx]
         competitive_matrix[team] = {
-            '财务激进度': financial_aggressiveness,
-            '市场侵略性': market_aggressiveness,
-            '技术投入度': tech_investment,
-            '策略类型': strategy_type
+            '财务激进度': float(financial_aggressiveness[t_idx]),
+            '市场侵略性': float(market_aggressiveness[t_idx]),
+            '技术投入度': float(tech_investment[t_idx]),
+            '策略类型': STRATEGY_TYPES[idx] if idx >= 0 else '未知'
         }
     
     return competitive_matrix
 
 
-def detect_strategy_changes(all_rounds_data, teams):
-    """策略突变检测"""
-    changes = {}
-    rounds = get_rounds_order(all_rounds_data)
+def _filled_ebitda(ebitda):
+    """EBITDA缺失或绝对值太小（<100，可能是百分比）时按0处理"""
+    return np.where(np.isnan(ebitda) | (np.abs(ebitda) < 100), 0.0, ebitda)
+
+
+def detect_strategy_changes(all_rounds_data, teams, tables=None):
+    """策略突变检测
     
-    for team in teams:
-        changes[team] = {
-            'alerts': [],
-            'changes': {}
-        }
-        
-        for i in range(len(rounds) - 1):
-            rnd1, rnd2 = rounds[i], rounds[i + 1]
-            
-            if rnd1 not in all_rounds_data or rnd2 not in all_rounds_data:
-                continue
-            
-            metrics1 = all_rounds_data[rnd1]
-            metrics2 = all_rounds_data[rnd2]
-            
-            # 1. 现金异常波动
-            cash1 = get_metric_with_priority(metrics1, '现金', team) or 0
-            cash2 = get_metric_with_priority(metrics2, '现金', team) or 0
-            cash_change = abs(cash2 - cash1)
-            
-            if cash_change > 500000:
-                changes[team]['alerts'].append({
-                    'type': '现金异常波动',
-                    'round': f'{rnd1}→{rnd2}',
-                    'value': cash_change,
-                    'interpretation': '可能融资/出售资产' if cash2 > cash1 else '可能大幅投资/亏损'
-                })
-            
-            # 2. 战略稳定性指数
-            # 使用优先级列表匹配EBITDA，确保提取到全局汇总值
-            ebitda1 = get_metric_value(metrics1, ['息税折旧及摊销前利润(EBITDA)', '息税折旧及摊销前利润', 'EBITDA'], team)
-            if ebitda1 is None or (ebitda1 is not None and abs(ebitda1) < 100):
-                ebitda1 = 0
-            else:
-                ebitda1 = ebitda1 or 0
-            
-            ebitda2 = get_metric_value(metrics2, ['息税折旧及摊销前利润(EBITDA)', '息税折旧及摊销前利润', 'EBITDA'], team)
-            if ebitda2 is None or (ebitda2 is not None and abs(ebitda2) < 100):
-                ebitda2 = 0
-            else:
-                ebitda2 = ebitda2 or 0
-            rd1 = get_metric_value(metrics1, '研发', team) or 0
-            rd2 = get_metric_value(metrics2, '研发', team) or 0
-            assets1 = get_metric_value(metrics1, '总资产', team) or 0
-            
-            if assets1 > 0:
-                stability_index = 1 - (abs(ebitda2 - ebitda1) + abs(rd2 - rd1)) / assets1
-                if stability_index < 0.3:
-                    changes[team]['alerts'].append({
-                        'type': '战略稳定性低',
-                        'round': f'{rnd1}→{rnd2}',
-                        'value': stability_index,
-                        'interpretation': '策略变化剧烈，需重点关注'
-                    })
+    tables: build_metric_tables 生成的指标表，为None时自动构建
+    """
+    rounds = get_rounds_order(all_rounds_data)
+    if tables is None:
+        tables = build_metric_tables(all_rounds_data, teams, rounds)
+    
+    cash = np.nan_to_num(tables['现金'])
+    ebitda = _filled_ebitda(tables['EBITDA'])
+    rd = np.nan_to_num(tables['研发'])
+    assets = np.nan_to_num(tables['总资产'])
+    
+    # 相邻回合之间的变化，shape=(回合数-1, 队伍数)
+    # 1. 现金异常波动
+    cash_change = np.abs(np.diff(cash, axis=0))
+    cash_alert = cash_change > 500000
+    # 2. 战略稳定性指数
+    prev_assets = assets[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stability = 1 - (np.abs(np.diff(ebitda, axis=0)) + np.abs(np.diff(rd, axis=0))) / prev_assets
+    stability_alert = (prev_assets > 0) & (stability < 0.3)
+    
+    changes = {team: {'alerts': [], 'changes': {}} for team in teams}
+    for i, t_idx in zip(*np.nonzero(cash_alert | stability_alert)):
+        alerts = changes[teams[t_idx]]['alerts']
+        round_pair = f'{rounds[i]}→{rounds[i + 1]}'
+        if cash_alert[i, t_idx]:
+            alerts.append({
+                'type': '现金异常波动',
+                'round': round_pair,
+                'value': float(cash_change[i, t_idx]),
+                'interpretation': '可能融资/出售资产' if cash[i + 1, t_idx] > cash[i, t_idx] else '可能大幅投资/亏损'
+            })
+        if stability_alert[i, t_idx]:
+            alerts.append({
+                'type': '战略稳定性低',
+                'round': round_pair,
+                'value': float(stability[i, t_idx]),
+                'interpretation': '策略变化剧烈，需重点关注'
+            })
     
     return changes
 
 
-def detect_region_entry(all_rounds_data, teams):
+def detect_region_entry(all_rounds_data, teams, region_sales=None):
     """
     检测区域市场进入（使用销售额替代市场份额）
     从方法论文档4.2.2节
+    
+    region_sales: build_region_sales_tensor 生成的区域销售额张量，为None时自动构建
     """
-    region_entry_alerts = {}
     rounds = get_rounds_order(all_rounds_data)
-    regions = ['美国', '亚洲', '欧洲']
-    
-    for team in teams:
-        region_entry_alerts[team] = []
-        
-        for region in regions:
-            prev_sales = 0
-            
-            for rnd in rounds:
-                if rnd in all_rounds_data:
-                    metrics_dict_rnd = all_rounds_data[rnd]
-                    # 修复：区域销售额指标名直接使用区域名，优先级匹配
-                    current_sales = get_metric_value(metrics_dict_rnd, region, team) or 0
-                    if (current_sales is None or current_sales == 0):
-                        current_sales = get_metric_value(metrics_dict_rnd, f'在{region}销售', team) or 0
-                    if (current_sales is None or current_sales == 0):
-                        current_sales = get_metric_value(metrics_dict_rnd, f'{region}销售额', team) or 0
-                    
-                    if prev_sales == 0 and current_sales and current_sales > 10000:  # 从无到有，销售额>10k
-                        region_entry_alerts[team].append({
-                            'region': region,
-                            'round': rnd,
-                            'sales': current_sales,
-                            'interpretation': f'新进入{region}市场'
-                        })
-                    prev_sales = current_sales or 0
+    if region_sales is None:
+        region_sales = build_region_sales_tensor(all_rounds_data, teams, rounds)
+    
+    # 从无到有（上回合为0，首回合视上回合为0），销售额>10k；shape=(区域数, 回合数, 队伍数)
+    prev_sales = np.zeros_like(region_sales)
+    prev_sales[:, 1:] = region_sales[:, :-1]
+    entry_mask = (prev_sales == 0) & (region_sales > 10000)
+    
+    region_entry_alerts = {team: [] for team in teams}
+    # 按 (队伍, 区域, 回合) 顺序生成提醒
+    for t_idx, g_idx, r_idx in np.argwhere(entry_mask.transpose(2, 0, 1)):
+        region = REGIONS[g_idx]
+        region_entry_alerts[teams[t_idx]].append({
+            'region': region,
+            'round': rounds[r_idx],
+            'sales': float(region_sales[g_idx, r_idx, t_idx]),
+            'interpretation': f'新进入{region}市场'
+        })
     
     return region_entry_alerts
 
 
-def predict_next_move(all_rounds_data, teams, round_name, derived_metrics):
-    """下回合意图预测"""
-    predictions = {}
+# 下回合意图信号（按判断顺序）
+NEXT_MOVE_SIGNALS = (
+    ('扩产', 70, '现金充足+销售增长'),
+    ('价格战', 60, '现金充足+排名靠后'),
+    ('技术投入', 75, '研发投入大，可能推出新技术'),
+    ('出售资产/退出', 80, '财务危机（高负债+负EBITDA）'),
+    ('紧急融资', 85, '现金不足+高负债'),
+)
+
+
+def predict_next_move(all_rounds_data, teams, round_name, derived_metrics, tables=None):
+    """下回合意图预测
+    
+    tables: 该回合的指标数组（build_round_tables 的结果），为None时从数据构建
+    """
     metrics_dict = all_rounds_data[round_name]
     derived = derived_metrics.get(round_name, {})
-    
-    for team in teams:
-        signals = []
-        
-        cash = get_metric_with_priority(metrics_dict, '现金', team) or 0
-        sales_growth = derived.get('销售额_环比增长', {}).get(team, 0)
-        sales_rank = derived.get('销售额_排名', {}).get(team, 999)
-        rd_expense = get_metric_value(metrics_dict, '研发', team) or 0
-        
-        equity = get_metric_value(metrics_dict, '权益合计', team) or 0
-        short_debt = get_metric_value(metrics_dict, '短期贷款', team) or 0
-        long_debt = get_metric_value(metrics_dict, '长期贷款', team) or 0
-        
-        # 修复：确保能提取到EBITDA值（优先使用全局汇总，避免百分比值）
-        ebitda = get_metric_value(metrics_dict, ['息税折旧及摊销前利润(EBITDA)', '息税折旧及摊销前利润', 'EBITDA'], team)
-        if ebitda is None or (ebitda is not None and abs(ebitda) < 100):
-            ebitda = 0
-        else:
-            ebitda = ebitda or 0
-        
-        if equity > 0:
-            net_debt = (short_debt + long_debt) - cash
-            debt_equity_ratio = (net_debt / equity) * 100
-        else:
-            debt_equity_ratio = 999
-        
-        # 扩产信号
-        if cash > 300000 and sales_growth > 10:
-            signals.append({
-                'action': '扩产',
-                'probability': 70,
-                'reason': '现金充足+销售增长'
-            })
-        
-        # 价格战信号
-        if cash > 500000 and sales_rank > 8:
-            signals.append({
-                'action': '价格战',
-                'probability': 60,
-                'reason': '现金充足+排名靠后'
-            })
-        
-        # 技术投入信号
-        if rd_expense > 400000:
-            signals.append({
-                'action': '技术投入',
-                'probability': 75,
-                'reason': '研发投入大，可能推出新技术'
-            })
-        
-        # 财务危机信号
-        if debt_equity_ratio > 100 and ebitda is not None and ebitda < 0:
-            signals.append({
-                'action': '出售资产/退出',
-                'probability': 80,
-                'reason': '财务危机（高负债+负EBITDA）'
-            })
-        
-        # 现金危机信号
-        if cash < 50000 and debt_equity_ratio > 70:
-            signals.append({
-                'action': '紧急融资',
-                'probability': 85,
-                'reason': '现金不足+高负债'
-            })
-        
-        predictions[team] = signals
+    if tables is None:
+        tables = build_round_tables(metrics_dict, teams)
+    
+    cash = np.nan_to_num(tables['现金'])
+    rd_expense = np.nan_to_num(tables['研发'])
+    equity = np.nan_to_num(tables['权益合计'])
+    short_debt = np.nan_to_num(tables['短期贷款'])
+    long_debt = np.nan_to_num(tables['长期贷款'])
+    # 修复：确保能提取到EBITDA值（优先使用全局汇总，避免百分比值）
+    ebitda = _filled_ebitda(tables['EBITDA'])
+    
+    growth = derived.get('销售额_环比增长', {})
+    ranks = derived.get('销售额_排名', {})
+    sales_growth = np.array([growth.get(team, 0) for team in teams], dtype=float)
+    sales_rank = np.array([ranks.get(team, 999) for team in teams], dtype=float)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        debt_equity_ratio = np.where(equity > 0, (((short_debt + long_debt) - cash) / equity) * 100, 999.0)
+    
+    # 各信号的触发条件，shape=(信号数, 队伍数)，与 NEXT_MOVE_SIGNALS 顺序一致
+    signal_masks = np.vstack([
+        (cash > 300000) & (sales_growth > 10),          # 扩产信号
+        (cash > 500000) & (sales_rank > 8),             # 价格战信号
+        rd_expense > 400000,                            # 技术投入信号
+        (debt_equity_ratio > 100) & (ebitda < 0),       # 财务危机信号
+        (cash < 50000) & (debt_equity_ratio > 70),      # 现金危机信号
+    ])
+    
+    predictions = {team: [] for team in teams}
+    for t_idx in np.flatnonzero(signal_masks.any(axis=0)):
+        predictions[teams[t_idx]] = [
+            {'action': action, 'probability': probability, 'reason': reason}
+            for (action, probability, reason), hit in zip(NEXT_MOVE_SIGNALS, signal_masks[:, t_idx])
+            if hit
+        ]
     
     return predictions
 
@@ -821,116 +868,92 @@ def predict_next_move(all_rounds_data, teams, round_name, derived_metrics):
 # 第五章：决策支持体系
 # ============================================================================
 
+# 生存模式、维持模式的固定建议：(模式, 行动建议, 资源分配, 风险等级)
+SURVIVAL_RECOMMENDATION = ('生存模式', ('停止所有投资', '出售闲置产能', '削减非必要费用'),
+                           {'研发': 0, '广告': 0, '现金保留': 100}, '高')
+MAINTAIN_RECOMMENDATION = ('维持模式', ('仅必要广告投入', '维持现有产能', '保留现金缓冲'),
+                           {'研发': 10, '广告': 20, '现金保留': 70}, '中')
+
+
 def generate_strategy_recommendations(health_data, cash_flow_data, competitive_matrix, 
                                      derived_metrics, latest_round, teams):
     """
     生成下回合策略建议（资源分配决策树）
     基于方法论文档5.2节
+    
+    决策树的各个分支先对所有队伍整体求值（布尔掩码），最后再逐队组装建议
     """
-    recommendations = {}
+    derived = derived_metrics.get(latest_round, {})
+    growth = derived.get('销售额_环比增长', {})
+    ranks = derived.get('销售额_排名', {})
+    
+    cash = np.array([value_or_zero(health_data.get(team, {}).get('indicators', {}).get('现金储备'))
+                     for team in teams], dtype=float)
+    sales_growth = np.array([growth.get(team, 0) for team in teams], dtype=float)
+    sales_rank = np.array([ranks.get(team, 999) for team in teams], dtype=float)
+    tech_investment = np.array([competitive_matrix.get(team, {}).get('技术投入度', 0) for team in teams],
+                               dtype=float)
+    
+    # 资源分配决策树：现金<100k为生存模式，<300k为维持模式，其余为进攻模式
+    attack = cash >= 300000
+    cash_reserve_pct = 20  # 保留20%现金作为风险缓冲
+    # 根据条件动态分配资源（确保总和不超过100%-现金保留）
+    max_available = 100 - cash_reserve_pct
+    
+    # 销售增长>10% → 扩产（降低到40%）
+    has_expand = attack & (sales_growth > 10)
+    expand_pct = np.where(has_expand, min(40, max_available), 0)
+    # 技术空白市场 → 研发（降低到30%）
+    has_rd = attack & (tech_investment < 5) & (expand_pct < max_available)
+    rd_pct = np.where(has_rd, np.minimum(30, max_available - expand_pct), 0)
+    allocated = expand_pct + rd_pct
+    # 份额领先 → 广告
+    has_ad = attack & (sales_rank <= 3) & (allocated < max_available)
+    ad_pct = np.where(has_ad, np.minimum(30, max_available - allocated), 0)
+    # 如果没有其他分配，默认分配到广告（降低到20%）
+    has_default = attack & ~(has_expand | has_rd | has_ad)
+    ad_pct = np.where(has_default, min(20, max_available), ad_pct)
+    allocated = allocated + ad_pct
+    # 剩余部分分配给现金保留（各项之和恰好为100%）
+    reserve_pct = cash_reserve_pct + np.maximum(0, max_available - allocated)
     
-    for team in teams:
-        health = health_data.get(team, {})
-        cash_flow = cash_flow_data.get(team, {})
-        comp_pos = competitive_matrix.get(team, {})
-        
-        cash = health.get('indicators', {}).get('现金储备', 0) or 0
-        derived = derived_metrics.get(latest_round, {})
-        sales_growth = derived.get('销售额_环比增长', {}).get(team, 0)
-        sales_rank = derived.get('销售额_排名', {}).get(team, 999)
-        
-        recommendation = {
-            'mode': '',
-            'actions': [],
-            'resource_allocation': {},
-            'risk_level': ''
-        }
-        
-        # 资源分配决策树
-        if cash < 100000:
-            # 生存模式
-            recommendation['mode'] = '生存模式'
-            recommendation['actions'] = [
-                '停止所有投资',
-                '出售闲置产能',
-                '削减非必要费用'
-            ]
-            recommendation['resource_allocation'] = {
-                '研发': 0,
-                '广告': 0,
-                '现金保留': 100
-            }
-            recommendation['risk_level'] = '高'
-        elif cash < 300000:
-            # 维持模式
-            recommendation['mode'] = '维持模式'
-            recommendation['actions'] = [
-                '仅必要广告投入',
-                '维持现有产能',
-                '保留现金缓冲'
-            ]
-            recommendation['resource_allocation'] = {
-                '研发': 10,
-                '广告': 20,
-                '现金保留': 70
+    recommendations = {}
+    for t_idx, team in enumerate(teams):
+        if not attack[t_idx]:
+            mode, actions, allocation, risk_level = (
+                SURVIVAL_RECOMMENDATION if cash[t_idx] < 100000 else MAINTAIN_RECOMMENDATION
+            )
+            recommendations[team] = {
+                'mode': mode,
+                'actions': list(actions),
+                'resource_allocation': dict(allocation),
+                'risk_level': risk_level
             }
-            recommendation['risk_level'] = '中'
-        else:
-            # 进攻模式
-            recommendation['mode'] = '进攻模式'
-            actions = []
-            allocation = {}
-            total_allocated = 0
-            cash_reserve_pct = 20  # 保留20%现金作为风险缓冲
-            
-            # 根据条件动态分配资源（确保总和不超过100%-现金保留）
-            max_available = 100 - cash_reserve_pct
-            
-            if sales_growth > 10:
-                actions.append('销售增长>10% → 考虑扩产')
-                if total_allocated < max_available:
-                    expand_pct = min(40, max_available - total_allocated)  # 降低到40%
-                    allocation['扩产'] = expand_pct
-                    total_allocated += expand_pct
-            
-            if comp_pos.get('技术投入度', 0) < 5 and total_allocated < max_available:
-                actions.append('技术空白市场 → 研发+进入')
-                rd_pct = min(30, max_available - total_allocated)  # 降低到30%
-                allocation['研发'] = rd_pct
-                total_allocated += rd_pct
-            
-            if sales_rank <= 3 and total_allocated < max_available:
-                actions.append('份额领先 → 增加广告巩固')
-                ad_pct = min(30, max_available - total_allocated)
-                allocation['广告'] = ad_pct
-                total_allocated += ad_pct
-            
-            # 如果没有其他分配，默认分配剩余资源到广告
-            if not allocation and max_available > 0:
-                actions.append('维持当前策略，适度投资')
-                allocation['广告'] = min(20, max_available)  # 降低到20%
-                total_allocated += allocation['广告']
-            
-            # 确保总和不超过100%，将剩余部分分配给现金保留
-            remaining = max_available - total_allocated
-            allocation['现金保留'] = cash_reserve_pct + max(0, remaining)
-            
-            # 最终验证：如果总和超过100%，按比例缩减
-            total = sum(v for v in allocation.values() if isinstance(v, (int, float)))
-            if total > 100:
-                scale = 100 / total
-                for key in allocation:
-                    if isinstance(allocation[key], (int, float)):
-                        allocation[key] = allocation[key] * scale
-            
-            if not actions:
-                actions.append('维持当前策略，观察对手动态')
-            
-            recommendation['actions'] = actions
-            recommendation['resource_allocation'] = allocation
-            recommendation['risk_level'] = '低'
+            continue
         
-        recommendations[team] = recommendation
+        # 进攻模式
+        actions = []
+        allocation = {}
+        if has_expand[t_idx]:
+            actions.append('销售增长>10% → 考虑扩产')
+            allocation['扩产'] = int(expand_pct[t_idx])
+        if has_rd[t_idx]:
+            actions.append('技术空白市场 → 研发+进入')
+            allocation['研发'] = int(rd_pct[t_idx])
+        if has_ad[t_idx]:
+            actions.append('份额领先 → 增加广告巩固')
+        if has_default[t_idx]:
+            actions.append('维持当前策略，适度投资')
+        if has_ad[t_idx] or has_default[t_idx]:
+            allocation['广告'] = int(ad_pct[t_idx])
+        allocation['现金保留'] = int(reserve_pct[t_idx])
+        
+        recommendations[team] = {
+            'mode': '进攻模式',
+            'actions': actions,
+            'resource_allocation': allocation,
+            'risk_level': '低'
+        }
     
     return recommendations
 
@@ -942,17 +965,23 @@ def generate_checklist(health_data, regional_data, strategy_changes, teams, late
     """
     checklist = {}
     
-    for team in teams:
+    # 各队伍 × 各区域的销售额和排名（无排名为NaN），用于市场策略检查
+    region_sales = np.array([[regional_data.get(team, {}).get(region, {}).get('销售额', 0) for region in REGIONS]
+                             for team in teams], dtype=float).reshape(len(teams), len(REGIONS))
+    region_ranks = np.array([[regional_data.get(team, {}).get(region, {}).get('排名') or np.nan for region in REGIONS]
+                             for team in teams], dtype=float).reshape(len(teams), len(REGIONS))
+    has_sales_all = (region_sales > 0).any(axis=1)
+    top_3_counts = (region_ranks <= 3).sum(axis=1)
+    
+    for t_idx, team in enumerate(teams):
         health = health_data.get(team, {})
-        regional = regional_data.get(team, {})
         changes = strategy_changes.get(team, {})
         
         indicators = health.get('indicators', {})
-        statuses = health.get('status', {})
         
-        cash = indicators.get('现金储备', 0) or 0
-        debt_equity = indicators.get('净债务权益比') or 0
-        red_count = sum(1 for s in statuses.values() if '🔴' in str(s))
+        cash = value_or_zero(indicators.get('现金储备'))
+        debt_equity = value_or_zero(indicators.get('净债务权益比'))
+        red_count = health.get('red_count', 0)
         
         checks = {
             '财务健康': [],
@@ -978,16 +1007,8 @@ def generate_checklist(health_data, regional_data, strategy_changes, teams, late
             checks['财务健康'].append('❌ 净债务/权益比过高（需要<70%）')
         
         # 市场策略检查
-        has_sales = False
-        top_3_count = 0
-        for region in ['美国', '亚洲', '欧洲']:
-            rp = regional.get(region, {})
-            if rp.get('销售额', 0) > 0:
-                has_sales = True
-            if rp.get('排名') and rp['排名'] <= 3:
-                top_3_count += 1
-        
-        if has_sales:
+        top_3_count = top_3_counts[t_idx]
+        if has_sales_all[t_idx]:
             checks['市场策略'].append('✅ 有区域销售额')
         else:
             checks['市场策略'].append('⚠️ 区域销售额为零')
@@ -1022,61 +1043,73 @@ def generate_checklist(health_data, regional_data, strategy_changes, teams, late
 # 报告生成
 # ============================================================================
 
-def generate_comprehensive_report(all_rounds_data, teams, health_data, cash_flow_data, 
-                                  regional_data, competitive_matrix, strategy_changes,
-                                  predictions, derived_metrics, anomalies, latest_round,
-                                  strategy_recommendations=None, checklist=None, region_entry_alerts=None):
-    """生成完整分析报告"""
-    report = []
-    
-    report.append("# 企业模拟经营战报分析报告（按方法论3.0）\n")
-    report.append(f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-    report.append("基于方法论文档3.0版本进行完整分析\n")
-    report.append("=" * 80 + "\n")
-    
-    # 一、执行摘要
-    report.append("\n## 一、执行摘要\n")
+# EBITDA率显示格式：(常规, 值很小时显示更多小数位)
+EBITDA_RATE_FORMATS = ('{:.1f}%', '{:.4f}%')
+
+
+def format_ebitda_rate(value):
+    """格式化EBITDA率（<0.1时保留4位小数，缺失时为N/A）"""
+    return 'N/A' if value is None else EBITDA_RATE_FORMATS[value < 0.1].format(value)
+
+
+# 逐队输出的表格行模板（导入时构造一次，生成报告时只需填充数值）
+CASH_FLOW_ROW = "| {team} | ${cash_change:.0f}k | ${ebitda:.0f}k | {cash_type} |\n".format
+COMPETITIVE_ROW = "| {team} | {fin:.1f}% | {mkt:.1f}% | {tech:.1f}% | {strategy} |\n".format
+QUADRANT_ROW = "| {team} | {fin:.1f}% | {tech:.1f}% | {mkt:.1f}% | {strategy} | {quadrant} |\n\n".format
+REGION_RANK_ROW = "| {rank} | {team} | ${sales:.0f}k | {share:.1f}% | {trend} |\n\n".format
+
+
+def format_cells(values, template):
+    """按 % 格式模板整体格式化数值数组，NaN显示为N/A"""
+    values = np.asarray(values, dtype=float)
+    formatted = np.char.mod(template, np.where(np.isnan(values), 0.0, values))
+    return np.where(np.isnan(values), 'N/A', formatted)
+
+
+def _report_header(report_ts):
+    """报告标题与生成时间"""
+    yield "# 企业模拟经营战报分析报告（按方法论3.0）\n\n"
+    yield f"生成时间：{report_ts}\n\n"
+    yield "基于方法论文档3.0版本进行完整分析\n\n"
+    yield "=" * 80 + "\n\n"
+
+
+def _report_summary(teams, health_data, strategy_changes, derived_metrics, latest_round, rounds, metric_tables):
+    """一、执行摘要"""
+    yield "\n## 一、执行摘要\n\n"
     
     # 找出领先队伍和关键指标
     sales_rankings = derived_metrics.get(latest_round, {}).get('销售额_排名', {})
-    metrics_dict = all_rounds_data[latest_round]
     
+    team_index = {team: t_idx for t_idx, team in enumerate(teams)}
     if sales_rankings:
-        top_teams = sorted(sales_rankings.items(), key=lambda x: x[1])[:3]
-        report.append("### 当前回合销售额排名TOP3：\n")
+        top_teams = nsmallest(3, sales_rankings.items(), key=itemgetter(1))
+        # 本回合指标，以及所有队伍的净利润环比增长率（无上一回合或上回合利润为0时为0）
+        latest_idx = rounds.index(latest_round)
+        profit = np.nan_to_num(metric_tables['净利润'][latest_idx])
+        cash = np.nan_to_num(metric_tables['现金'][latest_idx])
+        prev_profit = np.nan_to_num(metric_tables['净利润'][latest_idx - 1]) if latest_idx > 0 else np.zeros(len(teams))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            profit_growth = np.where(prev_profit != 0, ((profit - prev_profit) / np.abs(prev_profit)) * 100, 0.0)
+        yield "### 当前回合销售额排名TOP3：\n\n"
         for rank, (team, position) in enumerate(top_teams, 1):
-            # 获取关键指标
-            profit = get_metric_with_priority(metrics_dict, '净利润', team) or 0
-            cash = get_metric_with_priority(metrics_dict, '现金', team) or 0
-            # 确定上一回合（用于计算环比增长率）
-            rounds_order = get_rounds_order(all_rounds_data)
-            latest_idx = rounds_order.index(latest_round) if latest_round in rounds_order else -1
-            prev_round = rounds_order[latest_idx - 1] if latest_idx > 0 else None
-            if prev_round and prev_round in all_rounds_data:
-                prev_profit = get_metric_with_priority(all_rounds_data[prev_round], '净利润', team) or 0
-                if prev_profit != 0:
-                    profit_growth = ((profit - prev_profit) / abs(prev_profit)) * 100
-                else:
-                    profit_growth = 0
-            else:
-                profit_growth = 0
+            t_idx = team_index[team]
             
-            report.append(f"{rank}. **{team}**（排名：第{position}位）\n")
-            report.append(f"   - 净利润：${profit/1000:.0f}k（环比{profit_growth:+.1f}%）\n")
-            report.append(f"   - 现金：${cash/1000:.0f}k\n")
+            yield f"{rank}. **{team}**（排名：第{position}位）\n\n"
+            yield f"   - 净利润：${profit[t_idx]/1000:.0f}k（环比{profit_growth[t_idx]:+.1f}%）\n\n"
+            yield f"   - 现金：${cash[t_idx]/1000:.0f}k\n\n"
     
     # 核心问题识别
-    report.append("\n### 关键发现：\n")
+    yield "\n### 关键发现：\n\n"
     
     # 识别高风险队伍
     high_risk_teams = []
     for team, health in health_data.items():
-        red_count = sum(1 for s in health.get('status', {}).values() if '🔴' in str(s))
-        if red_count >= 2:
+        if health.get('red_count', 0) >= 2:
             high_risk_teams.append(team)
     
     if high_risk_teams:
-        report.append(f"- ⚠️ **高风险队伍**：{', '.join(high_risk_teams[:5])}（财务健康度有2个以上红灯）\n")
+        yield f"- ⚠️ **高风险队伍**：{', '.join(high_risk_teams[:5])}（财务健康度有2个以上红灯）\n\n"
     
     # 识别策略突变
     strategy_change_teams = []
@@ -1085,295 +1118,291 @@ def generate_comprehensive_report(all_rounds_data, teams, health_data, cash_flow
             strategy_change_teams.append(team)
     
     if strategy_change_teams:
-        report.append(f"- 🔄 **策略突变队伍**：{', '.join(strategy_change_teams[:3])}（需重点关注）\n")
-    
-    # 二、数据基础建设
-    report.append("\n\n## 二、数据基础建设\n")
+        yield f"- 🔄 **策略突变队伍**：{', '.join(strategy_change_teams[:3])}（需重点关注）\n\n"
+
+
+def _report_data_foundation(all_rounds_data, teams, anomalies, latest_round):
+    """二、数据基础建设"""
+    yield "\n\n## 二、数据基础建设\n\n"
     
-    report.append("### 2.1 数据完整性验证\n")
+    yield "### 2.1 数据完整性验证\n\n"
     validation_issues = validate_data_integrity(all_rounds_data[latest_round], teams)
     if validation_issues:
-        report.append("发现以下问题：\n")
+        yield "发现以下问题：\n\n"
         for issue in validation_issues[:5]:  # 只显示前5个
-            report.append(f"- {issue['team']}: 误差{issue['error_rate']:.2f}% - {issue['status']}\n")
+            yield f"- {issue['team']}: 误差{issue['error_rate']:.2f}% - {issue['status']}\n\n"
     else:
-        report.append("✅ 数据完整性验证通过\n")
+        yield "✅ 数据完整性验证通过\n\n"
     
-    report.append("\n### 2.2 异常值检测\n")
+    yield "\n### 2.2 异常值检测\n\n"
     if anomalies:
-        for team, anomaly_list in list(anomalies.items())[:5]:
-            report.append(f"\n**{team}**：\n")
+        for team, anomaly_list in islice(anomalies.items(), 5):
+            yield f"\n**{team}**：\n\n"
             for anomaly in anomaly_list:
-                report.append(f"- {anomaly['type']}: {anomaly['value']:,.0f} ({anomaly['rule']})\n")
+                yield f"- {anomaly['type']}: {anomaly['value']:,.0f} ({anomaly['rule']})\n\n"
     else:
-        report.append("✅ 未发现异常值\n")
-    
-    # 三、自身诊断分析
-    report.append("\n\n## 三、自身诊断分析\n")
+        yield "✅ 未发现异常值\n\n"
+
+
+def _report_self_diagnosis(teams, health_data, cash_flow_data, regional_data):
+    """三、自身诊断分析"""
+    yield "\n\n## 三、自身诊断分析\n\n"
+    
+    yield "### 3.1 财务健康度红绿灯系统\n\n"
+    yield "| 队伍 | 现金储备 | 净债务/权益比 | EBITDA率 | 权益比率 | 研发回报率 | 行动建议 |\n"
+    yield "|------|---------|--------------|---------|---------|-----------|---------|\n"
+    
+    # 整列格式化指标值和状态（缺失为N/A）
+    health_df = pd.DataFrame.from_dict(
+        {team: health_data.get(team, {}).get('indicators', {}) for team in teams},
+        orient='index', columns=list(HEALTH_INDICATORS), dtype=float
+    )
+    status_df = pd.DataFrame.from_dict(
+        {team: health_data.get(team, {}).get('status', {}) for team in teams},
+        orient='index', columns=list(HEALTH_INDICATORS), dtype=float
+    )
+    status_str = status_df.apply(lambda col: col.map(dict(enumerate(TRAFFIC_LIGHT_EMOJI))).fillna('N/A'))
     
-    report.append("### 3.1 财务健康度红绿灯系统\n")
-    report.append("| 队伍 | 现金储备 | 净债务/权益比 | EBITDA率 | 权益比率 | 研发回报率 | 行动建议 |")
-    report.append("|------|---------|--------------|---------|---------|-----------|---------|")
+    def fmt(values, template):
+        return values.map(template.format).where(values.notna(), 'N/A')
     
-    for team in teams:
-        h = health_data.get(team, {})
-        indicators = h.get('indicators', {})
-        statuses = h.get('status', {})
-        
-        cash_val = f"${indicators.get('现金储备', 0)/1000:.0f}k" if indicators.get('现金储备') is not None else "N/A"
-        cash_status = statuses.get('现金储备', 'N/A')
-        
-        debt_val = f"{indicators.get('净债务权益比', 0):.1f}%" if indicators.get('净债务权益比') is not None else "N/A"
-        debt_status = statuses.get('净债务权益比', 'N/A')
-        
+    ebitda_rate = health_df['EBITDA率']
+    value_str = {
+        '现金储备': fmt(health_df['现金储备'] / 1000, '${:.0f}k'),
+        '净债务权益比': fmt(health_df['净债务权益比'], '{:.1f}%'),
         # 修复：EBITDA率显示精度，当值很小时显示更多小数位
-        ebitda_rate = indicators.get('EBITDA率')
-        if ebitda_rate is not None:
-            if ebitda_rate < 0.1:
-                ebitda_val = f"{ebitda_rate:.4f}%"
-            else:
-                ebitda_val = f"{ebitda_rate:.1f}%"
-        else:
-            ebitda_val = "N/A"
-        ebitda_status = statuses.get('EBITDA率', 'N/A')
-        
-        equity_val = f"{indicators.get('权益比率', 0):.1f}%" if indicators.get('权益比率') is not None else "N/A"
-        equity_status = statuses.get('权益比率', 'N/A')
-        
-        rd_val = f"{indicators.get('研发回报率', 0):.1f}%" if indicators.get('研发回报率') is not None else "N/A"
-        rd_status = statuses.get('研发回报率', 'N/A')
-        
-        action = h.get('action_required', ['-'])[0] if h.get('action_required') else '-'
-        
-        report.append(f"| {team} | {cash_val} {cash_status} | {debt_val} {debt_status} | "
-                     f"{ebitda_val} {ebitda_status} | {equity_val} {equity_status} | "
-                     f"{rd_val} {rd_status} | {action} |")
+        'EBITDA率': fmt(ebitda_rate, EBITDA_RATE_FORMATS[1]).where(ebitda_rate < 0.1,
+                                                                 fmt(ebitda_rate, EBITDA_RATE_FORMATS[0])),
+        '权益比率': fmt(health_df['权益比率'], '{:.1f}%'),
+        '研发回报率': fmt(health_df['研发回报率'], '{:.1f}%'),
+    }
+    actions = pd.Series([(health_data.get(team, {}).get('action_required') or ['-'])[0] for team in teams],
+                        index=health_df.index)
+    
+    rows = '| ' + health_df.index.to_series()
+    for name in HEALTH_INDICATORS:
+        rows = rows + ' | ' + value_str[name] + ' ' + status_str[name]
+    rows = rows + ' | ' + actions + ' |\n'
+    yield from rows.tolist()
     
-    report.append("\n\n### 3.2 现金流源头分析\n")
-    report.append("| 队伍 | 现金变化 | 经营现金流(EBITDA) | 现金流类型 |")
-    report.append("|------|---------|------------------|-----------|")
+    yield "\n\n### 3.2 现金流源头分析\n\n"
+    yield "| 队伍 | 现金变化 | 经营现金流(EBITDA) | 现金流类型 |\n"
+    yield "|------|---------|------------------|-----------|\n"
     
     for team in teams:
         cf = cash_flow_data.get(team, {})
-        report.append(f"| {team} | ${cf.get('现金变化', 0)/1000:.0f}k | "
-                     f"${cf.get('经营现金流(EBITDA)', 0)/1000:.0f}k | {cf.get('现金流类型', 'N/A')} |")
+        yield CASH_FLOW_ROW(team=team, cash_change=cf.get('现金变化', 0) / 1000,
+                            ebitda=cf.get('经营现金流(EBITDA)', 0) / 1000, cash_type=cf.get('现金流类型', 'N/A'))
     
-    report.append("\n\n### 3.3 区域市场表现分析\n")
-    report.append("**数据说明**：由于Excel中区域销售额数据不可用或数据量极小（仅占总额的0.05%-0.65%），\n")
-    report.append("当前使用的'美国'、'亚洲'、'欧洲'指标的实际含义可能与区域销售额不符，仅供参考。\n\n")
+    yield "\n\n### 3.3 区域市场表现分析\n\n"
+    yield "**数据说明**：由于Excel中区域销售额数据不可用或数据量极小（仅占总额的0.05%-0.65%），\n\n"
+    yield "当前使用的'美国'、'亚洲'、'欧洲'指标的实际含义可能与区域销售额不符，仅供参考。\n\n\n"
     for team in teams[:5]:  # 显示前5个队伍
         regional = regional_data.get(team, {})
-        report.append(f"\n**{team}**：\n")
+        yield f"\n**{team}**：\n\n"
         has_any_sales = False
-        for region in ['美国', '亚洲', '欧洲']:
+        for region in REGIONS:
             rp = regional.get(region, {})
-            sales = rp.get('销售额', 0) or 0
+            sales = value_or_zero(rp.get('销售额'))
             if sales > 0:
                 has_any_sales = True
-                report.append(f"- **{region}**：")
-                report.append(f" 销售额 ${sales/1000:.0f}k")
+                # 同一区域的各项信息写在同一行
+                yield f"- **{region}**："
+                yield f" 销售额 ${sales/1000:.0f}k"
                 if rp.get('市场份额'):
-                    report.append(f"，市场份额 {rp['市场份额']:.1f}%")
+                    yield f"，市场份额 {rp['市场份额']:.1f}%"
                 if rp.get('排名'):
-                    report.append(f"，排名第{rp['排名']}位")
+                    yield f"，排名第{rp['排名']}位"
                 if rp.get('销售趋势'):
                     trend_symbol = "📈" if rp['销售趋势'] == '增长' else "📉" if rp['销售趋势'] == '下降' else "➡️"
-                    report.append(f"，趋势：{trend_symbol} {rp['销售趋势']}")
+                    yield f"，趋势：{trend_symbol} {rp['销售趋势']}"
                 if rp.get('策略建议'):
-                    report.append(f" → {'; '.join(rp['策略建议'])}\n")
+                    yield f" → {'; '.join(rp['策略建议'])}"
+                yield "\n"
         
         if not has_any_sales:
-            report.append("- ⚠️ 暂无区域销售额数据\n")
-    
-    # 四、竞争分析解码
-    report.append("\n\n## 四、竞争分析解码\n")
+            yield "- ⚠️ 暂无区域销售额数据\n\n"
+
+
+def _report_competition(teams, competitive_matrix, strategy_changes, predictions):
+    """四、竞争分析解码"""
+    yield "\n\n## 四、竞争分析解码\n\n"
     
-    report.append("### 4.1 三维度对标矩阵\n")
-    report.append("| 队伍 | 财务激进度 | 市场侵略性 | 技术投入度 | 策略类型 |")
-    report.append("|------|-----------|-----------|-----------|---------|")
+    yield "### 4.1 三维度对标矩阵\n\n"
+    yield "| 队伍 | 财务激进度 | 市场侵略性 | 技术投入度 | 策略类型 |\n"
+    yield "|------|-----------|-----------|-----------|---------|\n"
     
     for team in teams:
         cm = competitive_matrix.get(team, {})
-        report.append(f"| {team} | {cm.get('财务激进度', 0):.1f}% | "
-                     f"{cm.get('市场侵略性', 0):.1f}% | {cm.get('技术投入度', 0):.1f}% | "
-                     f"{cm.get('策略类型', '未知')} |")
+        yield COMPETITIVE_ROW(team=team, fin=cm.get('财务激进度', 0), mkt=cm.get('市场侵略性', 0),
+                              tech=cm.get('技术投入度', 0), strategy=cm.get('策略类型', '未知'))
     
-    report.append("\n\n### 4.2 策略突变检测\n")
+    yield "\n\n### 4.2 策略突变检测\n\n"
     for team in teams:
         changes = strategy_changes.get(team, {})
         if changes.get('alerts'):
-            report.append(f"\n**{team}**：\n")
+            yield f"\n**{team}**：\n\n"
             for alert in changes['alerts'][:3]:  # 只显示前3个警报
-                report.append(f"- ⚠️ {alert['type']} ({alert['round']}): {alert.get('interpretation', '')}\n")
+                yield f"- ⚠️ {alert['type']} ({alert['round']}): {alert.get('interpretation', '')}\n\n"
     
-    report.append("\n\n### 4.3 下回合意图预测\n")
+    yield "\n\n### 4.3 下回合意图预测\n\n"
     for team in teams:
         pred = predictions.get(team, [])
         if pred:
-            report.append(f"\n**{team}**：\n")
+            yield f"\n**{team}**：\n\n"
             for signal in pred[:3]:  # 只显示前3个信号
-                report.append(f"- {signal['action']} (概率{signal['probability']}%): {signal['reason']}\n")
-    
-    # 五、多回合趋势分析
-    report.append("\n\n## 五、多回合趋势分析\n")
+                yield f"- {signal['action']} (概率{signal['probability']}%): {signal['reason']}\n\n"
+
+
+def _report_trends(teams, rounds, metric_tables, derived_metrics):
+    """五、多回合趋势分析"""
+    yield "\n\n## 五、多回合趋势分析\n\n"
     
-    rounds = get_rounds_order(all_rounds_data)
     available_rounds = rounds  # 已经过滤了，直接使用
+    trend_metrics = ('销售额', '净利润', '现金')
+    shown_teams = teams[:8]
+    
+    # 环比增长率一次性展开为表：行为队伍，列为 (指标, 回合)
+    growth_df = pd.DataFrame(
+        {(metric_name, rnd): derived_metrics.get(rnd, {}).get(f'{metric_name}_环比增长', {})
+         for metric_name in trend_metrics for rnd in available_rounds[1:]},
+        index=list(shown_teams), columns=pd.MultiIndex.from_product([trend_metrics, available_rounds[1:]]),
+        dtype=float
+    )
     
-    for metric_name in ['销售额', '净利润', '现金']:
-        report.append(f"\n### {metric_name}趋势\n")
-        report.append("| 队伍 | " + " | ".join([r.upper() for r in available_rounds]) + " |")
-        report.append("|------|" + "|".join(["------" for _ in available_rounds]) + "|\n")
+    for metric_name in trend_metrics:
+        table = metric_tables[metric_name]
+        yield f"\n### {metric_name}趋势\n\n"
+        yield "| 队伍 | " + " | ".join([r.upper() for r in available_rounds]) + " |\n"
+        yield "|------|" + "|".join(["------" for _ in available_rounds]) + "|\n\n"
         
-        for team in teams[:8]:  # 显示前8个队伍
-            values = []
-            for rnd in available_rounds:
-                val = get_metric_with_priority(all_rounds_data[rnd], metric_name, team)
-                if val is not None:
-                    if metric_name == '现金':
-                        values.append(f"${val/1000:.0f}k")
-                    else:
-                        values.append(f"{val/1000:.0f}k")
-                else:
-                    values.append("N/A")
-            report.append(f"| {team} | " + " | ".join(values) + " |\n")
+        # 前8个队伍 × 各回合的单元格整体格式化（行为队伍，列为回合）
+        template = '$%.0fk' if metric_name == '现金' else '%.0fk'
+        cells = format_cells(table[:, :len(shown_teams)].T / 1000, template)
+        for team, row in zip(shown_teams, cells.tolist()):
+            yield f"| {team} | " + " | ".join(row) + " |\n\n"
         
         # 添加环比增长率
         if len(available_rounds) > 1:
-            report.append("\n**环比增长率**：\n")
-            report.append("| 队伍 | " + " | ".join([f"{r.upper()}" for r in available_rounds[1:]]) + " |")
-            report.append("|------|" + "|".join(["------" for _ in available_rounds[1:]]) + "|\n")
+            yield "\n**环比增长率**：\n\n"
+            yield "| 队伍 | " + " | ".join([f"{r.upper()}" for r in available_rounds[1:]]) + " |\n"
+            yield "|------|" + "|".join(["------" for _ in available_rounds[1:]]) + "|\n\n"
             
-            for team in teams[:8]:
-                growth_rates = []
-                for i in range(1, len(available_rounds)):
-                    rnd = available_rounds[i]
-                    derived = derived_metrics.get(rnd, {})
-                    growth = derived.get(f'{metric_name}_环比增长', {}).get(team)
-                    if growth is not None:
-                        growth_rates.append(f"{growth:+.1f}%")
-                    else:
-                        growth_rates.append("N/A")
-                report.append(f"| {team} | " + " | ".join(growth_rates) + " |\n")
-    
-    # 六、决策建议（第五章内容）
-    if strategy_recommendations:
-        report.append("\n\n## 六、决策建议\n")
-        
-        report.append("### 6.1 下回合策略建议\n")
-        for team in teams[:5]:  # 显示前5个队伍
-            rec = strategy_recommendations.get(team, {})
-            if rec:
-                report.append(f"\n**{team}**：")
-                report.append(f"\n- 模式：{rec.get('mode', 'N/A')}（风险等级：{rec.get('risk_level', 'N/A')}）")
-                report.append(f"- 行动建议：")
-                for action in rec.get('actions', []):
-                    report.append(f"  - {action}")
-                if rec.get('resource_allocation'):
-                    report.append(f"- 资源分配：")
-                    for item, value in rec.get('resource_allocation', {}).items():
-                        report.append(f"  - {item}: {value}%")
-        
-        report.append("\n\n### 6.2 区域市场进入检测\n")
-        if region_entry_alerts:
-            for team in teams:
-                alerts = region_entry_alerts.get(team, [])
-                if alerts:
-                    report.append(f"\n**{team}**：\n")
-                    for alert in alerts[:3]:  # 只显示前3个
-                        report.append(f"- ⚠️ {alert.get('interpretation', '')}（{alert.get('round', '')}，销售额：${alert.get('sales', 0)/1000:.0f}k）\n")
-    
-    # 七、核心检查清单
-    if checklist:
-        report.append("\n\n## 七、核心检查清单\n")
-        report.append("**提交决策前必答问题**：\n")
-        
-        for team in teams[:3]:  # 显示前3个队伍
-            checks = checklist.get(team, {})
-            if checks:
-                report.append(f"\n### {team}\n")
-                
-                for category, items in checks.items():
-                    report.append(f"\n**{category}检查**：\n")
-                    for item in items:
-                        report.append(f"- {item}\n")
-    
-    # 八、可视化图表描述（方法论文档6.2节）
-    report.append("\n\n## 八、关键图表描述\n")
-    report.append("> 注：以下为图表的文本描述，实际可视化图表可使用matplotlib等工具生成\n\n")
+            growth = growth_df[metric_name].to_numpy()
+            for team, row in zip(shown_teams, format_cells(growth, '%+.1f%%').tolist()):
+                yield f"| {team} | " + " | ".join(row) + " |\n\n"
+
+
+def _report_recommendations(teams, strategy_recommendations, region_entry_alerts):
+    """六、决策建议（第五章内容）"""
+    yield "\n\n## 六、决策建议\n\n"
+
+    yield "### 6.1 下回合策略建议\n\n"
+    for team in teams[:5]:  # 显示前5个队伍
+        rec = strategy_recommendations.get(team, {})
+        if rec:
+            yield f"\n**{team}**：\n"
+            yield f"\n- 模式：{rec.get('mode', 'N/A')}（风险等级：{rec.get('risk_level', 'N/A')}）\n"
+            yield f"- 行动建议：\n"
+            for action in rec.get('actions', []):
+                yield f"  - {action}\n"
+            if rec.get('resource_allocation'):
+                yield f"- 资源分配：\n"
+                for item, value in rec.get('resource_allocation', {}).items():
+                    yield f"  - {item}: {value}%\n"
+
+    yield "\n\n### 6.2 区域市场进入检测\n\n"
+    if region_entry_alerts:
+        for team in teams:
+            alerts = region_entry_alerts.get(team, [])
+            if alerts:
+                yield f"\n**{team}**：\n\n"
+                for alert in alerts[:3]:  # 只显示前3个
+                    yield f"- ⚠️ {alert.get('interpretation', '')}（{alert.get('round', '')}，销售额：${alert.get('sales', 0)/1000:.0f}k）\n\n"
+
+
+def _report_checklist(teams, checklist):
+    """七、核心检查清单"""
+    yield "\n\n## 七、核心检查清单\n\n"
+    yield "**提交决策前必答问题**：\n\n"
+
+    for team in teams[:3]:  # 显示前3个队伍
+        checks = checklist.get(team, {})
+        if checks:
+            yield f"\n### {team}\n\n"
+
+            for category, items in checks.items():
+                yield f"\n**{category}检查**：\n\n"
+                for item in items:
+                    yield f"- {item}\n\n"
+
+
+def _report_charts(teams, health_data, competitive_matrix, regional_data):
+    """八、关键图表描述（方法论文档6.2节）"""
+    yield "\n\n## 八、关键图表描述\n\n"
+    yield "> 注：以下为图表的文本描述，实际可视化图表可使用matplotlib等工具生成\n\n\n"
     
     # 1. 财务健康度仪表盘
-    report.append("### 8.1 财务健康度仪表盘\n")
-    report.append("**指标状态概览**：\n\n")
+    yield "### 8.1 财务健康度仪表盘\n\n"
+    yield "**指标状态概览**：\n\n\n"
     for team in teams[:5]:
         health = health_data.get(team, {})
         statuses = health.get('status', {})
         indicators = health.get('indicators', {})
         
-        report.append(f"**{team}**：\n")
-        for ind_name in ['现金储备', '净债务权益比', 'EBITDA率', '权益比率', '研发回报率']:
-            status = statuses.get(ind_name, 'N/A')
+        yield f"**{team}**：\n\n"
+        for ind_name in HEALTH_INDICATORS:
+            status = format_status(statuses.get(ind_name))
             value = indicators.get(ind_name)
             if value is not None:
                 if ind_name == '现金储备':
-                    report.append(f"- {ind_name}: ${value/1000:.0f}k {status}\n")
+                    yield f"- {ind_name}: ${value/1000:.0f}k {status}\n\n"
                 elif ind_name == 'EBITDA率':
                     # 修复：EBITDA率显示精度
-                    if value < 0.1:
-                        report.append(f"- {ind_name}: {value:.4f}% {status}\n")
-                    else:
-                        report.append(f"- {ind_name}: {value:.1f}% {status}\n")
+                    yield f"- {ind_name}: {format_ebitda_rate(value)} {status}\n\n"
                 else:
-                    report.append(f"- {ind_name}: {value:.1f}% {status}\n")
+                    yield f"- {ind_name}: {value:.1f}% {status}\n\n"
             else:
-                report.append(f"- {ind_name}: N/A {status}\n")
-        report.append("\n")
+                yield f"- {ind_name}: N/A {status}\n\n"
+        yield "\n\n"
     
     # 2. 竞争态势矩阵描述
-    report.append("\n### 8.2 竞争态势矩阵图\n")
-    report.append("**维度分布**（X轴：财务激进度，Y轴：技术投入度，气泡大小：市场侵略性）：\n\n")
-    report.append("| 队伍 | 财务激进度 | 技术投入度 | 市场侵略性 | 策略类型 | 象限位置 |\n")
-    report.append("|------|-----------|-----------|-----------|---------|---------|\n")
-    
-    for team in teams:
-        cm = competitive_matrix.get(team, {})
-        fin_agg = cm.get('财务激进度', 0)
-        tech_inv = cm.get('技术投入度', 0)
-        mkt_agg = cm.get('市场侵略性', 0)
-        strategy = cm.get('策略类型', '未知')
-        
-        # 判断象限位置（优化999%的显示）
-        if fin_agg >= 999:
-            fin_pos = "极端激进（权益<0）"
-        elif fin_agg > 50:
-            fin_pos = "高"
-        else:
-            fin_pos = "低"
-        
-        if tech_inv > 10:
-            tech_pos = "高"
-        else:
-            tech_pos = "低"
-        
-        if fin_agg >= 999:
-            quadrant = f"极端激进×{tech_pos}技术"
-        else:
-            quadrant = f"{fin_pos}财务×{tech_pos}技术"
-        
-        report.append(f"| {team} | {fin_agg:.1f}% | {tech_inv:.1f}% | {mkt_agg:.1f}% | {strategy} | {quadrant} |\n")
+    yield "\n### 8.2 竞争态势矩阵图\n\n"
+    yield "**维度分布**（X轴：财务激进度，Y轴：技术投入度，气泡大小：市场侵略性）：\n\n\n"
+    yield "| 队伍 | 财务激进度 | 技术投入度 | 市场侵略性 | 策略类型 | 象限位置 |\n\n"
+    yield "|------|-----------|-----------|-----------|---------|---------|\n\n"
+    
+    def matrix_column(name):
+        return np.array([competitive_matrix.get(team, {}).get(name, 0) for team in teams], dtype=float)
+    
+    fin_agg = matrix_column('财务激进度')
+    tech_inv = matrix_column('技术投入度')
+    mkt_agg = matrix_column('市场侵略性')
+    
+    # 判断象限位置（优化999%的显示：权益<0时财务激进度记为999）
+    tech_pos = np.where(tech_inv > 10, '高', '低')
+    fin_pos = np.where(fin_agg > 50, '高', '低')
+    quadrant = np.where(fin_agg >= 999,
+                        np.char.add(np.char.add('极端激进×', tech_pos), '技术'),
+                        np.char.add(np.char.add(np.char.add(fin_pos, '财务×'), tech_pos), '技术'))
+    
+    for t_idx, team in enumerate(teams):
+        strategy = competitive_matrix.get(team, {}).get('策略类型', '未知')
+        yield QUADRANT_ROW(team=team, fin=fin_agg[t_idx], tech=tech_inv[t_idx], mkt=mkt_agg[t_idx],
+                           strategy=strategy, quadrant=quadrant[t_idx])
     
     # 3. 多回合趋势对比
-    report.append("\n### 8.3 多回合趋势对比图\n")
-    report.append("**关键指标趋势**（详见第五章多回合趋势分析部分）：\n")
-    report.append("- 销售额：整体趋势向上/向下/稳定\n")
-    report.append("- 净利润：盈利改善/恶化/波动\n")
-    report.append("- 现金：现金流健康/紧张/危机\n")
+    yield "\n### 8.3 多回合趋势对比图\n\n"
+    yield "**关键指标趋势**（详见第五章多回合趋势分析部分）：\n\n"
+    yield "- 销售额：整体趋势向上/向下/稳定\n\n"
+    yield "- 净利润：盈利改善/恶化/波动\n\n"
+    yield "- 现金：现金流健康/紧张/危机\n\n"
     
     # 4. 区域市场表现
-    report.append("\n### 8.4 区域市场表现图\n")
-    report.append("**区域销售额排名**：\n\n")
-    for region in ['美国', '亚洲', '欧洲']:
-        report.append(f"**{region}市场**：\n")
+    yield "\n### 8.4 区域市场表现图\n\n"
+    yield "**区域销售额排名**：\n\n\n"
+    for region in REGIONS:
+        yield f"**{region}市场**：\n\n"
         
         # 获取该区域所有队伍的排名（修复：只有销售额>0的队伍才排名）
         region_rankings = []
@@ -1381,7 +1410,7 @@ def generate_comprehensive_report(all_rounds_data, teams, health_data, cash_flow
             regional = regional_data.get(team, {})
             rp = regional.get(region, {})
             # 修复：只有销售额>0且有排名才加入排名列表
-            sales = rp.get('销售额', 0) or 0
+            sales = value_or_zero(rp.get('销售额'))
             if rp.get('排名') and sales > 0:
                 region_rankings.append({
                     'team': team,
@@ -1391,16 +1420,68 @@ def generate_comprehensive_report(all_rounds_data, teams, health_data, cash_flow
                 })
         
         if region_rankings:
-            region_rankings.sort(key=lambda x: x['rank'])
-            report.append("| 排名 | 队伍 | 销售额 | 市场份额 | 趋势 |\n")
-            report.append("|------|------|--------|---------|------|\n")
-            for item in region_rankings[:5]:
+            yield "| 排名 | 队伍 | 销售额 | 市场份额 | 趋势 |\n\n"
+            yield "|------|------|--------|---------|------|\n\n"
+            for item in nsmallest(5, region_rankings, key=itemgetter('rank')):
                 # 判断趋势（简化：如果有排名变化数据则使用）
                 trend = "→"  # 默认稳定
-                report.append(f"| {item['rank']} | {item['team']} | ${item['sales']/1000:.0f}k | {item['market_share']:.1f}% | {trend} |\n")
-        report.append("\n")
+                yield REGION_RANK_ROW(rank=item['rank'], team=item['team'], sales=item['sales'] / 1000,
+                                      share=item['market_share'], trend=trend)
+        yield "\n\n"
+
+
+def iter_report(all_rounds_data, teams, health_data, cash_flow_data,
+                regional_data, competitive_matrix, strategy_changes,
+                predictions, derived_metrics, anomalies, latest_round,
+                strategy_recommendations=None, checklist=None, region_entry_alerts=None,
+                metric_tables=None, report_ts=None):
+    """按章节逐段生成报告内容（生成器）
+    
+    每个章节由独立的 _report_* 生成器产出，未提供数据的章节（决策建议、检查清单）
+    直接跳过，不做任何计算；调用方可用 f.writelines(iter_report(...)) 边生成边写入。
+    metric_tables: build_metric_tables 生成的指标表，为None时自动构建；
+                   报告中按 (回合, 队伍) 读取的指标值均直接从表中取，不再逐次查询
+    report_ts: 报告生成时间字符串，为None时取当前时间
+    """
+    if report_ts is None:
+        report_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rounds = get_rounds_order(all_rounds_data)
+    if metric_tables is None:
+        metric_tables = build_metric_tables(all_rounds_data, teams, rounds)
+    
+    yield from _report_header(report_ts)
+    yield from _report_summary(teams, health_data, strategy_changes, derived_metrics, latest_round,
+                               rounds, metric_tables)
+    yield from _report_data_foundation(all_rounds_data, teams, anomalies, latest_round)
+    yield from _report_self_diagnosis(teams, health_data, cash_flow_data, regional_data)
+    yield from _report_competition(teams, competitive_matrix, strategy_changes, predictions)
+    yield from _report_trends(teams, rounds, metric_tables, derived_metrics)
+    if strategy_recommendations:
+        yield from _report_recommendations(teams, strategy_recommendations, region_entry_alerts)
+    if checklist:
+        yield from _report_checklist(teams, checklist)
+    yield from _report_charts(teams, health_data, competitive_matrix, regional_data)
+
+
+def generate_comprehensive_report(all_rounds_data, teams, health_data, cash_flow_data, 
+                                  regional_data, competitive_matrix, strategy_changes,
+                                  predictions, derived_metrics, anomalies, latest_round,
+                                  strategy_recommendations=None, checklist=None, region_entry_alerts=None,
+                                  metric_tables=None, out=None, report_ts=None):
+    """生成完整分析报告
     
-    return "\n".join(report)
+    参数同 iter_report。
+    out: 报告写入目标（已打开的文件等可write的对象），报告内容边生成边写入；
+         为None时在内存中生成并返回报告字符串
+    """
+    chunks = iter_report(all_rounds_data, teams, health_data, cash_flow_data,
+                         regional_data, competitive_matrix, strategy_changes,
+                         predictions, derived_metrics, anomalies, latest_round,
+                         strategy_recommendations, checklist, region_entry_alerts, metric_tables,
+                         report_ts)
+    if out is None:
+        return ''.join(chunks)
+    out.writelines(chunks)
 
 
 # ============================================================================
@@ -1408,48 +1489,53 @@ def generate_comprehensive_report(all_rounds_data, teams, health_data, cash_flow
 # ============================================================================
 
 def validate_logic(all_rounds_data, teams, health_data, derived_metrics, 
-                  competitive_matrix, latest_round):
+                  competitive_matrix, latest_round, tables=None):
     """
     验证分析逻辑的合理性和一致性
+    
+    tables: 最新回合的指标数组（build_round_tables 的结果），为None时从数据构建
     """
     issues = []
     
-    metrics_dict = all_rounds_data[latest_round]
-    
-    # 1. 验证财务健康度计算的一致性
-    for team in teams:
-        health = health_data.get(team, {})
-        indicators = health.get('indicators', {})
-        
-        # 验证现金提取
-        cash_health = indicators.get('现金储备')
-        cash_direct = get_metric_with_priority(metrics_dict, '现金', team) or 0
-        if cash_health and abs(cash_health - cash_direct) > 0.01:
+    if tables is None:
+        tables = build_round_tables(all_rounds_data[latest_round], teams)
+    
+    # 1. 验证财务健康度计算的一致性（对所有队伍整体计算，只为有问题的队伍生成记录）
+    def stored(name):
+        values = [health_data.get(team, {}).get('indicators', {}).get(name) for team in teams]
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+    
+    cash_health = stored('现金储备')
+    stored_debt_equity = stored('净债务权益比')
+    cash = np.nan_to_num(tables['现金'])
+    equity = np.nan_to_num(tables['权益合计'])
+    short_debt = np.nan_to_num(tables['短期贷款'])
+    long_debt = np.nan_to_num(tables['长期贷款'])
+    
+    # 验证现金提取（健康度中现金为0或缺失时不检查）
+    cash_mismatch = (np.nan_to_num(cash_health) != 0) & (np.abs(cash_health - cash) > 0.01)
+    # 验证净债务/权益比计算
+    with np.errstate(divide='ignore', invalid='ignore'):
+        calculated_debt_equity = ((short_debt + long_debt - cash) / equity) * 100
+    debt_equity_mismatch = ((equity > 0) & ~np.isnan(stored_debt_equity)
+                            & (np.abs(calculated_debt_equity - stored_debt_equity) > 0.1))
+    
+    for t_idx in np.flatnonzero(cash_mismatch | debt_equity_mismatch):
+        team = teams[t_idx]
+        if cash_mismatch[t_idx]:
             issues.append({
                 'type': '数据不一致',
                 'team': team,
                 'metric': '现金',
-                'description': f'健康度计算中的现金值({cash_health})与直接提取值({cash_direct})不一致'
+                'description': f'健康度计算中的现金值({float(cash_health[t_idx])})与直接提取值({float(cash[t_idx])})不一致'
+            })
+        if debt_equity_mismatch[t_idx]:
+            issues.append({
+                'type': '计算不一致',
+                'team': team,
+                'metric': '净债务权益比',
+                'description': f'计算值({calculated_debt_equity[t_idx]:.2f}%)与存储值({stored_debt_equity[t_idx]:.2f}%)不一致'
             })
-        
-        # 验证净债务/权益比计算
-        equity = get_metric_value(metrics_dict, '权益合计', team) or 0
-        short_debt = get_metric_value(metrics_dict, '短期贷款', team) or 0
-        long_debt = get_metric_value(metrics_dict, '长期贷款', team) or 0
-        cash = get_metric_with_priority(metrics_dict, '现金', team) or 0
-        
-        if equity > 0:
-            calculated_debt_equity = ((short_debt + long_debt - cash) / equity) * 100
-            stored_debt_equity = indicators.get('净债务权益比')
-            
-            if stored_debt_equity is not None:
-                if abs(calculated_debt_equity - stored_debt_equity) > 0.1:
-                    issues.append({
-                        'type': '计算不一致',
-                        'team': team,
-                        'metric': '净债务权益比',
-                        'description': f'计算值({calculated_debt_equity:.2f}%)与存储值({stored_debt_equity:.2f}%)不一致'
-                    })
     
     # 2. 验证资源分配总和
     # (这部分在主函数中调用时验证)
@@ -1511,20 +1597,26 @@ def main(input_dir=None, output_dir=None):
     # 第一步：数据基础建设
     print("\n【第一步：数据基础建设】")
     all_rounds_data = {}
-    teams = []
+    teams = ()
+    clear_metric_cache()
     
+    round_files = {}
     for round_name, file_path in FILES.items():
         if not file_path.exists():
             print(f"警告: 文件不存在 {file_path}")
             continue
-        
+        round_files[round_name] = file_path
+    
+    # 各回合文件并行解析
+    loaded = read_many_excel_data(round_files.values())
+    for round_name, (metrics_dict, round_teams) in zip(round_files, loaded):
         print(f"  正在处理 {round_name}...")
-        metrics_dict, round_teams = read_excel_data(str(file_path))
         
         if not teams:
             teams = normalize_team_names(round_teams)
         
         all_rounds_data[round_name] = metrics_dict
+        register_metrics_dict(metrics_dict)
         print(f"    [OK] 提取到 {len(metrics_dict)} 个指标")
         print(f"    [OK] 队伍数量: {len(round_teams)}")
     
@@ -1541,52 +1633,59 @@ def main(input_dir=None, output_dir=None):
             latest_round = rnd
             break
     if latest_round is None:
-        latest_round = list(all_rounds_data.keys())[0]  # 使用第一个可用的回合
+        latest_round = next(iter(all_rounds_data))  # 使用第一个可用的回合
     print(f"\n  最新回合: {latest_round}")
     
+    # 构建SoA指标表（所有回合、队伍的常用指标只解析一次）
+    rounds = get_rounds_order(all_rounds_data)
+    metric_tables = build_metric_tables(all_rounds_data, teams, rounds)
+    latest_idx = rounds.index(latest_round)
+    prev_round = get_prev_round_map(rounds).get(latest_round)
+    latest_tables = {name: table[latest_idx] for name, table in metric_tables.items()}
+    
     # 异常值检测
-    anomalies = detect_anomalies(all_rounds_data[latest_round], teams)
+    anomalies = detect_anomalies(all_rounds_data[latest_round], teams, latest_tables)
     print(f"  检测到 {sum(len(v) for v in anomalies.values())} 个异常值")
     
     # 计算衍生指标
     print("\n  计算衍生指标...")
-    derived_metrics = calculate_derived_metrics(all_rounds_data, teams)
+    derived_metrics = calculate_derived_metrics(all_rounds_data, teams, metric_tables)
     print(f"    [OK] 完成")
     
     # 第二步：自身诊断分析
     print("\n【第二步：自身诊断分析】")
     
     print("  计算财务健康度...")
-    health_data = calculate_financial_health(all_rounds_data[latest_round], teams)
+    health_data = calculate_financial_health(all_rounds_data[latest_round], teams, latest_tables)
     
     print("  分析现金流...")
-    # 确定上一回合（用于现金流分析）
-    rounds_order = get_rounds_order(all_rounds_data)
-    latest_idx = rounds_order.index(latest_round) if latest_round in rounds_order else -1
-    if latest_idx > 0:
-        prev_round = rounds_order[latest_idx - 1]
-    else:
-        prev_round = None
     prev_metrics = all_rounds_data.get(prev_round, {}) if prev_round else {}
-    cash_flow_data = analyze_cash_flow_source(all_rounds_data[latest_round], teams, prev_metrics)
+    prev_tables = {name: table[latest_idx - 1] for name, table in metric_tables.items()} if prev_round else None
+    cash_flow_data = analyze_cash_flow_source(all_rounds_data[latest_round], teams, prev_metrics,
+                                              latest_tables, prev_tables)
     
     print("  分析区域市场表现...")
-    regional_data = analyze_regional_market(all_rounds_data, teams, latest_round)
+    region_sales = build_region_sales_tensor(all_rounds_data, teams, rounds)
+    regional_data = analyze_regional_market(
+        all_rounds_data, teams, latest_round, prev_round,
+        sales=region_sales[:, latest_idx],
+        prev_sales=region_sales[:, latest_idx - 1] if prev_round else None
+    )
     
     # 第三步：竞争分析解码
     print("\n【第三步：竞争分析解码】")
     
     print("  计算三维度对标矩阵...")
-    competitive_matrix = calculate_competitive_position(all_rounds_data[latest_round], teams)
+    competitive_matrix = calculate_competitive_position(all_rounds_data[latest_round], teams, latest_tables)
     
     print("  检测策略突变...")
-    strategy_changes = detect_strategy_changes(all_rounds_data, teams)
+    strategy_changes = detect_strategy_changes(all_rounds_data, teams, metric_tables)
     
     print("  预测下回合意图...")
-    predictions = predict_next_move(all_rounds_data, teams, latest_round, derived_metrics)
+    predictions = predict_next_move(all_rounds_data, teams, latest_round, derived_metrics, latest_tables)
     
     print("  检测区域市场进入...")
-    region_entry_alerts = detect_region_entry(all_rounds_data, teams)
+    region_entry_alerts = detect_region_entry(all_rounds_data, teams, region_sales)
     
     # 第四步：决策支持体系
     print("\n【第四步：决策支持体系】")
@@ -1606,7 +1705,7 @@ def main(input_dir=None, output_dir=None):
     print("\n【逻辑验证检查】")
     logic_issues = validate_logic(
         all_rounds_data, teams, health_data, derived_metrics,
-        competitive_matrix, latest_round
+        competitive_matrix, latest_round, latest_tables
     )
     if logic_issues:
         print(f"  发现 {len(logic_issues)} 个逻辑问题，已记录")
@@ -1625,19 +1724,19 @@ def main(input_dir=None, output_dir=None):
     # 第五步：生成报告
     print("\n【第五步：生成分析报告】")
     
-    report = generate_comprehensive_report(
-        all_rounds_data, teams, health_data, cash_flow_data,
-        regional_data, competitive_matrix, strategy_changes,
-        predictions, derived_metrics, anomalies, latest_round,
-        strategy_recommendations, checklist, region_entry_alerts
-    )
-    
-    # 保存报告
+    # 生成报告并直接写入文件
     output_dir.mkdir(parents=True, exist_ok=True)
     output_file = output_dir / '方法论3.0完整分析报告.md'
+    report_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(report)
+        f.writelines(iter_report(
+            all_rounds_data, teams, health_data, cash_flow_data,
+            regional_data, competitive_matrix, strategy_changes,
+            predictions, derived_metrics, anomalies, latest_round,
+            strategy_recommendations, checklist, region_entry_alerts,
+            metric_tables, report_ts
+        ))
     
     print(f"\n  [OK] 报告已保存到: {output_file}")
     print("\n" + "=" * 80)
@@ -5,49 +5,93 @@
 """
 
 import sys
+import io
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 from pathlib import Path
+from datetime import datetime
 
 # 添加utils目录到路径
 sys.path.insert(0, str(Path(__file__).parent.parent / 'utils'))
 sys.path.insert(0, str(Path(__file__).parent))
 
-from utils_data_analysis import read_excel_data
-from analyze_team_detail import analyze_team_detailed
+from utils_data_analysis import register_metrics_dict
+from analyze_team_detail import load_all_rounds, build_report
 
-def main(input_dir, output_dir):
-    """为所有队伍生成详细分析报告"""
+# 工作进程共享的 (all_rounds_data, teams)，由 _init_worker 在每个进程中设置一次
+_SHARED_DATA = None
+
+def _init_worker(all_rounds_data, teams):
+    """进程池初始化：保存共享数据并登记指标字典（同一进程内的查询可复用缓存）"""
+    global _SHARED_DATA
+    _SHARED_DATA = (all_rounds_data, teams)
+    for metrics_dict in all_rounds_data.values():
+        register_metrics_dict(metrics_dict)
+
+def _build_team_report(team, output_dir, timestamp):
+    """生成单个队伍报告，返回生成过程中的输出文本（由主进程按队伍顺序打印）"""
+    all_rounds_data, teams = _SHARED_DATA
+    log = io.StringIO()
+    with redirect_stdout(log):
+        build_report(team, all_rounds_data, teams, output_dir, timestamp)
+    return log.getvalue()
+
+def main(input_dir, output_dir, max_workers=None):
+    """为所有队伍生成详细分析报告
+    
+    各队伍报告相互独立，使用多进程并行生成（max_workers 默认为CPU核数，为1时顺序生成）；
+    进程池不可用或工作进程异常退出时退回在主进程中生成
+    """
     
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # 读取数据文件获取所有队伍名称
-    ir00_path = input_dir / 'results-ir00.xls'
-    if not ir00_path.exists():
-        # 尝试读取 r01 或 pr01
-        r01_path = input_dir / 'results-r01.xls'
-        if not r01_path.exists():
-            r01_path = input_dir / 'results-pr01.xls'
-        if r01_path.exists():
-            _, teams = read_excel_data(str(r01_path))
-        else:
-            print(f"错误: 未找到数据文件")
-            return
-    else:
-        _, teams = read_excel_data(str(ir00_path))
+    # 数据文件只读取一次，所有队伍的报告共用
+    all_rounds_data, teams = load_all_rounds(input_dir)
+    if not all_rounds_data:
+        print(f"错误: 未找到数据文件")
+        return
     
     print(f"找到 {len(teams)} 支队伍")
     print(f"队伍列表: {', '.join(teams)}")
     print("\n开始生成各队伍详细分析报告...\n")
     
-    # 为每支队伍生成报告
-    for i, team in enumerate(teams, 1):
-        print(f"[{i}/{len(teams)}] 正在生成 {team} 的分析报告...")
+    # 为每支队伍生成报告（并行提交，按队伍顺序取结果并输出进度）；同一批报告使用相同的生成时间
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    executor = None
+    jobs = None
+    if max_workers != 1 and len(teams) > 1:
         try:
-            analyze_team_detailed(team, str(input_dir), str(output_dir))
-            print(f"  ✓ {team} 报告生成成功")
-        except Exception as e:
-            print(f"  ✗ {team} 报告生成失败: {e}")
+            executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                           initargs=(all_rounds_data, teams))
+            jobs = [executor.submit(_build_team_report, team, output_dir, timestamp).result for team in teams]
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            pass  # 当前环境不支持多进程
+    if jobs is None:
+        _init_worker(all_rounds_data, teams)
+        jobs = [partial(_build_team_report, team, output_dir, timestamp) for team in teams]
+    
+    try:
+        for i, (team, job) in enumerate(zip(teams, jobs), 1):
+            print(f"[{i}/{len(teams)}] 正在生成 {team} 的分析报告...")
+            try:
+                try:
+                    log = job()
+                except BrokenProcessPool:
+                    # 工作进程异常退出（如被系统终止）：该队伍改在主进程中生成
+                    if _SHARED_DATA is None:
+                        _init_worker(all_rounds_data, teams)
+                    log = _build_team_report(team, output_dir, timestamp)
+                print(log, end='')
+                print(f"  ✓ {team} 报告生成成功")
+            except Exception as e:
+                print(f"  ✗ {team} 报告生成失败: {e}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
     
     print(f"\n所有报告已生成到: {output_dir}")
 
@@ -57,7 +101,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='批量生成所有队伍的详细分析报告')
     parser.add_argument('--input-dir', '-i', type=str, required=True, help='数据输入目录')
     parser.add_argument('--output-dir', '-o', type=str, required=True, help='报告输出目录')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='并行进程数（默认为CPU核数，1为顺序生成）')
     
     args = parser.parse_args()
-    main(args.input_dir, args.output_dir)
+    main(args.input_dir, args.output_dir, args.workers)
 
@@ -8,9 +8,92 @@
 import pandas as pd
 import numpy as np
 import os
+import hashlib
+import pickle
+import re
+import sys
+import tempfile
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
+from types import MappingProxyType
 
-def read_excel_data(file_path, team_row_idx=4, data_start_row=5):
+# Rust实现的Excel读取器（可选）；只检测是否安装，实际导入由 pandas 在首次读取时完成
+HAS_CALAMINE = importlib.util.find_spec('python_calamine') is not None
+
+
+def get_excel_engine(file_path):
+    """
+    根据文件类型选择Excel读取引擎
+    优先使用 calamine（需安装 python-calamine），否则 .xls 用 xlrd，.xlsx 用 openpyxl
+    """
+    if HAS_CALAMINE:
+        return 'calamine'
+    return _builtin_excel_engine(file_path)
+
+
+def _builtin_excel_engine(file_path):
+    """不依赖 calamine 的读取引擎：.xls 用 xlrd，其余用 openpyxl（pandas 以只读、仅取值模式打开）"""
+    if str(file_path).lower().endswith('.xls'):
+        return 'xlrd'
+    return 'openpyxl'
+
+
+# 数值文本中需去掉的千分位逗号、货币符号、百分号和空白（一次扫描完成清理）
+_CLEAN_PATTERN = re.compile(r'[,$%\s]')
+# 可由float()解析的数值文本（先筛选再转换，无需对每个单元格 try/except）
+_NUMBER_PATTERN = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+
+def _cells_to_float(cells):
+    """
+    将单元格表格按列整体转换为浮点数组（缺失或无法解析为NaN）
+    数值（含布尔）列直接转换；文本列先去掉千分位逗号、$、%和空白再解析；日期等其他类型的列为NaN
+    """
+    def convert(col):
+        if pd.api.types.is_numeric_dtype(col) or pd.api.types.is_bool_dtype(col):
+            return pd.to_numeric(col, errors='coerce')
+        if not (col.dtype == object or pd.api.types.is_string_dtype(col)):
+            return pd.Series(np.nan, index=col.index)  # 日期等其他类型的列不是数值
+        col = col.astype(object)  # 全为文本的列（如pandas 3的str类型）同样需要清理
+        is_text = col.map(type).eq(str)
+        numbers = pd.to_numeric(col.mask(is_text), errors='coerce')
+        text = col[is_text].str.replace(_CLEAN_PATTERN, '', regex=True)
+        # 按Python float规则解析（to_numeric的文本解析末位可能有舍入差异）
+        text = text[text.str.fullmatch(_NUMBER_PATTERN)]
+        return numbers.fillna(text.astype(float))
+    
+    return cells.apply(convert).to_numpy(dtype=float).reshape(cells.shape)
+
+
+def _file_cache_key(file_path):
+    """文件缓存键：(绝对路径, 修改时间, 文件大小)，文件被改写后缓存自动失效"""
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+@lru_cache(maxsize=32)
+def _load_results_sheet(path, mtime_ns, size, engine):
+    """
+    读取工作簿的工作表列表和 Results 工作表原始内容
+    
+    按 _file_cache_key 缓存，同一文件在 read_excel_data、check_excel_structure、
+    diagnose_missing_data 等之间只解析一次（返回的DataFrame只读，不可修改）
+    """
+    try:
+        with pd.ExcelFile(path, engine=engine) as excel_file:
+            return excel_file.sheet_names, excel_file.parse('Results', header=None)
+    except Exception:
+        if engine != 'calamine':
+            raise
+    # calamine 无法解析该文件时退回 xlrd/openpyxl
+    return _load_results_sheet(path, mtime_ns, size, _builtin_excel_engine(path))
+
+
+def read_excel_data(file_path, team_row_idx=4, data_start_row=5, engine=None):
     """
     读取Excel文件并解析数据结构
     
@@ -18,29 +101,38 @@ def read_excel_data(file_path, team_row_idx=4, data_start_row=5):
         file_path: Excel文件路径
         team_row_idx: 队伍名称所在行索引（默认4，即第5行）
         data_start_row: 数据开始行索引（默认5，即第6行）
+        engine: Excel读取引擎（默认由 get_excel_engine 按文件类型选择）
     
     Returns:
-        metrics_dict: 指标字典，格式为 {指标名: {队伍名: 数值}}
+        metrics_dict: 指标字典，格式为 {指标名: {队伍名: 数值}}（指标名为已去除首尾空白的字符串）
         teams: 队伍列表
     """
-    df = pd.read_excel(file_path, sheet_name='Results', header=None)
-    
-    # 获取队伍名称
+    if engine is None:
+        engine = get_excel_engine(file_path)
+    _, df = _load_results_sheet(*_file_cache_key(file_path), engine)
+    return _parse_results_sheet(df, team_row_idx, data_start_row)
+
+
+def _parse_results_sheet(df, team_row_idx=4, data_start_row=5):
+    """将 Results 工作表原始内容解析为 (metrics_dict, teams)，参数含义同 read_excel_data"""
+    # 获取队伍名称（驻留字符串：各回合、各指标的队伍键共用同一对象，字典查找可直接按身份命中）
     team_row = df.iloc[team_row_idx]
-    teams = [str(t).strip() for t in team_row[1:] if pd.notna(t) and str(t).strip() != '']
+    teams = [sys.intern(name) for name in team_row.iloc[1:].dropna().astype(str).str.strip() if name != '']
     
-    # 从数据开始行读取数据
-    data_df = df.iloc[data_start_row:].copy()
-    data_df.columns = ['指标'] + teams + ['Unnamed'] * (len(data_df.columns) - len(teams) - 1)
+    # 从数据开始行读取数据：指标名一列（去除首尾空白后驻留，后续比较无需再规范化）；
+    # 各队伍的单元格整体转换为数值（缺失或无法解析为None）
+    body = df.iloc[data_start_row:]
+    indicators = body.iloc[:, 0]
+    indicators = list(map(sys.intern, indicators.where(indicators.notna(), '').astype(str).str.strip()))
+    values = _cells_to_float(body.iloc[:, 1:len(teams) + 1])
+    rows = np.where(np.isnan(values), None, values).tolist()
     
     # 构建指标字典
     metrics_dict = {}
     # 用于跟踪区域上下文（如"损益表, 千 USD, 全球"）
     current_section = None
     
-    for idx, row in data_df.iterrows():
-        indicator = str(row['指标']).strip() if pd.notna(row['指标']) else ''
-        
+    for indicator, row_values in zip(indicators, rows):
         if indicator == '' or indicator == 'nan':
             continue
         
@@ -49,27 +141,8 @@ def read_excel_data(file_path, team_row_idx=4, data_start_row=5):
             current_section = indicator
             continue
         
-        # 提取各队伍的数据
-        team_data = {}
-        for team in teams:
-            val = row[team]
-            if pd.notna(val):
-                try:
-                    # 转换为数值
-                    if isinstance(val, (int, float)):
-                        team_data[team] = float(val)
-                    elif isinstance(val, str):
-                        cleaned = val.replace(',', '').replace('$', '').replace('%', '').replace(' ', '').strip()
-                        if cleaned:
-                            team_data[team] = float(cleaned)
-                        else:
-                            team_data[team] = None
-                    else:
-                        team_data[team] = None
-                except:
-                    team_data[team] = None
-            else:
-                team_data[team] = None
+        # 各队伍的数据
+        team_data = dict(zip(teams, row_values))
         
         if any(v is not None for v in team_data.values()):
             # 如果指标名称已存在，检查是否需要合并或选择最优值
@@ -98,6 +171,85 @@ def read_excel_data(file_path, team_row_idx=4, data_start_row=5):
     return metrics_dict, teams
 
 
+# 解析结果磁盘缓存版本（解析逻辑变化时递增，使旧缓存失效）
+PARSE_CACHE_VERSION = 4
+
+
+def read_excel_data_cached(file_path, cache_dir=None, engine=None):
+    """
+    读取Excel数据（带磁盘缓存），返回值与 read_excel_data 相同
+    以 (路径, 修改时间, 文件大小) 为键，首次解析后将结果序列化到数据目录下的 .cache/，
+    后续运行直接从缓存加载，跳过耗时的Excel解析
+    engine: 缓存未命中时使用的Excel读取引擎（默认按文件类型自动选择）
+    """
+    cache_file = _parse_cache_file(file_path, cache_dir)
+    result = _load_parse_cache(cache_file)
+    if result is not None:
+        return result
+    
+    result = read_excel_data(str(file_path), engine=engine)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # 先写入同目录下的临时文件再原子替换，同时运行的其他脚本不会读到写了一半的缓存
+        fd, tmp_path = tempfile.mkstemp(dir=cache_file.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(result, f, protocol=5)
+            os.replace(tmp_path, cache_file)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    except OSError:
+        pass  # 缓存写入失败不影响分析
+    return result
+
+
+def _parse_cache_file(file_path, cache_dir=None):
+    """解析结果的缓存文件路径（文件名为缓存版本、路径、修改时间和文件大小的哈希）"""
+    file_path = Path(file_path)
+    cache_dir = Path(cache_dir) if cache_dir is not None else file_path.parent / '.cache'
+    stat = file_path.stat()
+    key = hashlib.blake2b(
+        f"{PARSE_CACHE_VERSION}|{file_path.resolve()}|{stat.st_mtime_ns}|{stat.st_size}".encode('utf-8')
+    ).hexdigest()
+    return cache_dir / f'{key}.pkl'
+
+
+def _load_parse_cache(cache_file):
+    """读取缓存的解析结果；缓存不存在或已损坏时返回 None"""
+    if cache_file.exists():
+        try:
+            with open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass  # 缓存损坏，重新解析
+    return None
+
+
+def read_many_excel_data(file_paths, max_workers=4):
+    """
+    读取多个Excel文件，返回与 file_paths 顺序一致的 (metrics_dict, teams) 列表
+    磁盘缓存已命中的文件直接加载；其余文件相互独立，使用多进程并行解析（结果同样写入缓存），
+    进程池不可用或工作进程异常退出时退回顺序读取
+    """
+    file_paths = [Path(file_path) for file_path in file_paths]
+    results = [_load_parse_cache(_parse_cache_file(file_path)) for file_path in file_paths]
+    missing = [i for i, result in enumerate(results) if result is None]
+    
+    if len(missing) > 1 and max_workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+                parsed = list(executor.map(read_excel_data_cached, [file_paths[i] for i in missing]))
+            for i, result in zip(missing, parsed):
+                results[i] = result
+            missing = []
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            pass  # 当前环境不支持多进程或工作进程异常退出，未完成的文件改为顺序读取
+    for i in missing:
+        results[i] = read_excel_data_cached(file_paths[i])
+    return results
+
+
 def find_metric(metrics_dict, keywords, exact_match=False):
     """
     根据关键词查找指标
@@ -113,15 +265,16 @@ def find_metric(metrics_dict, keywords, exact_match=False):
     if isinstance(keywords, str):
         keywords = [keywords]
     
-    for key in metrics_dict.keys():
-        for keyword in keywords:
-            if exact_match:
-                if keyword == str(key).strip():
-                    return metrics_dict[key]
-            else:
-                if keyword in str(key):
-                    return metrics_dict[key]
-    return {}
+    if exact_match:
+        # 精确匹配直接查字典（指标名读取时已去除首尾空白）；多个关键词都命中时取字典中最先出现的指标
+        hits = {keyword for keyword in keywords if keyword in metrics_dict}
+        if len(hits) > 1:
+            return metrics_dict[next(key for key in metrics_dict if key in hits)]
+        return metrics_dict[hits.pop()] if hits else {}
+    
+    # 部分匹配：字典中最先出现的、包含任一关键词的指标
+    key = _first_key_matching_any(metrics_dict, tuple(keywords))
+    return metrics_dict[key] if key is not None else {}
 
 
 def list_all_metrics(file_path, max_count=200):
@@ -136,7 +289,7 @@ def list_all_metrics(file_path, max_count=200):
         指标列表
     """
     metrics_dict, teams = read_excel_data(file_path)
-    return list(metrics_dict.keys())[:max_count]
+    return list(islice(metrics_dict, max_count))
 
 
 def check_excel_structure(file_path):
@@ -149,36 +302,45 @@ def check_excel_structure(file_path):
     Returns:
         结构信息字典
     """
-    excel_file = pd.ExcelFile(file_path)
-    df = pd.read_excel(file_path, sheet_name='Results', header=None)
-    
-    # 获取队伍信息
-    team_row = df.iloc[4]
-    teams = [str(t).strip() for t in team_row[1:] if pd.notna(t) and str(t).strip() != '']
+    # 工作簿只打开一次：工作表列表、表格尺寸和指标解析共用同一份（缓存的）工作表内容
+    sheet_names, df = _load_results_sheet(*_file_cache_key(file_path), get_excel_engine(file_path))
     
-    # 获取所有指标
-    metrics_dict, _ = read_excel_data(file_path)
+    # 获取所有指标及队伍信息（直接解析已读取的工作表）
+    metrics_dict, teams = _parse_results_sheet(df)
     
-    # 查找区域相关指标
+    # 区域、市场、需求、产能相关指标的关键词
     regions = ['美国', '亚洲', '欧洲', 'America', 'Asia', 'Europe']
-    region_metrics = {}
-    for region in regions:
-        region_metrics[region] = [k for k in metrics_dict.keys() if region in str(k)]
-    
-    # 查找市场相关指标
     market_keywords = ['市场', '份额', '占有率']
-    market_metrics = [k for k in metrics_dict.keys() if any(kw in str(k) for kw in market_keywords)]
-    
-    # 查找需求相关指标
     demand_keywords = ['需求', '未满足']
-    demand_metrics = [k for k in metrics_dict.keys() if any(kw in str(k) for kw in demand_keywords)]
-    
-    # 查找产能相关指标
     capacity_keywords = ['产能', '利用率', '产量']
-    capacity_metrics = [k for k in metrics_dict.keys() if any(kw in str(k) for kw in capacity_keywords)]
+    
+    region_metrics = {region: [] for region in regions}
+    market_metrics = []
+    demand_metrics = []
+    capacity_metrics = []
+    
+    # 关键词 -> 命中后应归入的类别列表
+    targets = {}
+    for region in regions:
+        targets.setdefault(region, []).append(region_metrics[region])
+    for keywords, bucket in ((market_keywords, market_metrics),
+                             (demand_keywords, demand_metrics),
+                             (capacity_keywords, capacity_metrics)):
+        for kw in keywords:
+            targets.setdefault(kw, []).append(bucket)
+    
+    # 所有关键词合成一个正则（前瞻匹配，重叠出现的关键词也能找到），每个指标名只扫描一次
+    pattern = re.compile('(?=(' + '|'.join(map(re.escape, targets)) + '))')
+    for key in metrics_dict:
+        hit = {}
+        for kw in pattern.findall(key):
+            for bucket in targets[kw]:
+                hit[id(bucket)] = bucket
+        for bucket in hit.values():
+            bucket.append(key)
     
     return {
-        'sheet_names': excel_file.sheet_names,
+        'sheet_names': sheet_names,
         'shape': df.shape,
         'teams': teams,
         'total_metrics': len(metrics_dict),
@@ -220,73 +382,165 @@ def diagnose_missing_data(file_path, target_metrics=None, target_team=None):
         'similar_metrics': {}
     }
     
+    # 先尝试精确匹配；其余指标的类似指标在一次遍历中统一收集
+    exact_matches = {}
     for metric in target_metrics:
-        # 尝试精确匹配
         exact_match = find_metric(metrics_dict, [metric], exact_match=True)
         if exact_match:
-            diagnosis['found_metrics'][metric] = exact_match.get(target_team)
+            exact_matches[metric] = exact_match
+    similar = _keys_containing(metrics_dict, [m for m in target_metrics if m not in exact_matches])
+    
+    for metric in target_metrics:
+        if metric in exact_matches:
+            diagnosis['found_metrics'][metric] = exact_matches[metric].get(target_team)
             continue
         
-        # 尝试部分匹配
-        partial_match = find_metric(metrics_dict, [metric], exact_match=False)
-        if partial_match:
-            # 找到类似的指标
-            similar_keys = [k for k in metrics_dict.keys() if metric in str(k)]
-            if similar_keys:
-                diagnosis['similar_metrics'][metric] = similar_keys
-                diagnosis['found_metrics'][metric] = partial_match.get(target_team)
-                continue
+        # 尝试部分匹配（第一个类似指标即部分匹配的结果）
+        similar_keys = similar[metric]
+        if similar_keys:
+            diagnosis['similar_metrics'][metric] = similar_keys
+            diagnosis['found_metrics'][metric] = metrics_dict[similar_keys[0]].get(target_team)
+            continue
         
         diagnosis['missing_metrics'].append(metric)
     
     return diagnosis
 
 
+# 指标查询缓存：id(指标字典) -> 字典本身（登记期间持有引用，id不会被复用）
+_DICT_REGISTRY = {}
+
+
+def register_metrics_dict(metrics_dict):
+    """登记指标字典（登记后不应再修改），之后对它的 get_metric_value 查询结果会被缓存"""
+    _DICT_REGISTRY[id(metrics_dict)] = metrics_dict
+
+
+def clear_metric_cache():
+    """清空已登记的字典和指标查询缓存（重新加载数据前调用）"""
+    _DICT_REGISTRY.clear()
+    _cached_metric_value.cache_clear()
+    _cached_matching_keys.cache_clear()
+    _cached_first_key.cache_clear()
+
+
+def _is_registered(metrics_dict):
+    return _DICT_REGISTRY.get(id(metrics_dict)) is metrics_dict
+
+
+@lru_cache(maxsize=4096)
+def _cached_metric_value(dict_id, metric_key, team_name):
+    return _lookup_metric_value(_DICT_REGISTRY[dict_id], metric_key, team_name)
+
+
+@lru_cache(maxsize=4096)
+def _cached_matching_keys(dict_id, name):
+    return tuple(key for key in _DICT_REGISTRY[dict_id] if name in key)
+
+
+def _matching_keys(metrics_dict, name):
+    """名称中包含 name 的所有指标名（保持字典顺序）；已登记的字典按 (字典id, name) 缓存"""
+    if _is_registered(metrics_dict):
+        return _cached_matching_keys(id(metrics_dict), name)
+    return [key for key in metrics_dict if name in key]
+
+
+def _keys_containing(metrics_dict, names):
+    """
+    {name: 名称中包含 name 的所有指标名（保持字典顺序）}
+    所有 name 合成一个前瞻正则（长的在前），只遍历一次字典；命中较长的 name 时，
+    它所包含的较短 name 也一并计入（同一位置只会报告一个分支）
+    """
+    result = {name: [] for name in names}
+    if not result:
+        return result
+    ordered = sorted(result, key=len, reverse=True)
+    contained = {name: [other for other in ordered if other in name] for name in ordered}
+    pattern = re.compile('(?=(' + '|'.join(map(re.escape, ordered)) + '))')
+    for key in metrics_dict:
+        hit = set()
+        for name in pattern.findall(key):
+            hit.update(contained[name])
+        for name in hit:
+            result[name].append(key)
+    return result
+
+
+def _scan_first_key(metrics_dict, keywords):
+    pattern = re.compile('|'.join(map(re.escape, keywords)))
+    return next((key for key in metrics_dict if pattern.search(key)), None)
+
+
+@lru_cache(maxsize=4096)
+def _cached_first_key(dict_id, keywords):
+    return _scan_first_key(_DICT_REGISTRY[dict_id], keywords)
+
+
+def _first_key_matching_any(metrics_dict, keywords):
+    """字典中最先出现的、名称包含任一关键词的指标名（无则为None）；已登记的字典按 (字典id, 关键词) 缓存"""
+    if not keywords:
+        return None
+    if _is_registered(metrics_dict):
+        return _cached_first_key(id(metrics_dict), keywords)
+    return _scan_first_key(metrics_dict, keywords)
+
+
 def get_metric_value(metrics_dict, metric_name, team_name):
     """
     获取特定队伍和指标的数值（支持优先级列表）
     优先匹配全局汇总值，避免匹配到区域性的值
+    已用 register_metrics_dict 登记的字典按 (字典id, 指标名/优先级元组, 队伍) 缓存查询结果
     
     Args:
         metrics_dict: 指标字典
-        metric_name: 指标名称（可以是字符串或列表，列表表示按优先级匹配）
+        metric_name: 指标名称（可以是字符串或列表/元组，列表表示按优先级匹配）
         team_name: 队伍名称
     
     Returns:
         指标值，如果未找到返回None
     """
-    # 如果metric_name是列表，按优先级顺序尝试匹配
+    if not _is_registered(metrics_dict):
+        return _lookup_metric_value(metrics_dict, metric_name, team_name)
     if isinstance(metric_name, list):
+        metric_name = tuple(metric_name)
+    return _cached_metric_value(id(metrics_dict), metric_name, team_name)
+
+
+def _lookup_metric_value(metrics_dict, metric_name, team_name):
+    """get_metric_value 的实际查找逻辑（不经过缓存）"""
+    # 如果metric_name是列表（或元组），按优先级顺序尝试匹配
+    if isinstance(metric_name, (list, tuple)):
         all_matches = []
         for name in metric_name:
             # 查找所有匹配的指标
-            for key, metric_data in metrics_dict.items():
-                if name in str(key) and team_name in metric_data:
+            for key in _matching_keys(metrics_dict, name):
+                metric_data = metrics_dict[key]
+                if team_name in metric_data:
                     val = metric_data.get(team_name)
                     if val is not None:
                         # 验证数据合理性
                         # 对于负债相关指标，如果值为负数且不是"总计"，跳过（可能是区域值）
-                        if '负债' in str(key) and val < 0 and '总计' not in str(key):
+                        if '负债' in key and val < 0 and '总计' not in key:
                             continue
                         
                         # 对于EBITDA，优先选择数值大的（>100），表示全局汇总金额值
                         # 数值小的（<100）可能是百分比值，应该排除
-                        if 'EBITDA' in str(key) or '息税折旧' in str(key):
+                        if 'EBITDA' in key or '息税折旧' in key:
                             if abs(val) < 100:
                                 continue  # 跳过百分比值
                         
                         # 优先选择全局汇总表的数据（在"资产负债表, 千 USD, 全球"或"损益表, 千 USD, 全球"部分）
                         priority = 0
-                        if '全球' in str(key) or '总计' in str(key):
+                        if '全球' in key or '总计' in key:
                             priority = 3
-                        elif any(region in str(key) for region in ['美国', '亚洲', '欧洲', 'America', 'Asia', 'Europe']):
+                        elif any(region in key for region in ['美国', '亚洲', '欧洲', 'America', 'Asia', 'Europe']):
                             priority = 1
                         
                         # 对于EBITDA，数值越大通常表示全局汇总，给予更高优先级
-                        if ('EBITDA' in str(key) or '息税折旧' in str(key)) and abs(val) > 1000:
+                        if ('EBITDA' in key or '息税折旧' in key) and abs(val) > 1000:
                             priority += 2
                         
-                        all_matches.append((priority, abs(val), val, str(key)))
+                        all_matches.append((priority, abs(val), val, key))
         
         if all_matches:
             # 按优先级和数值大小排序，优先返回全局汇总的大数值
@@ -296,22 +550,23 @@ def get_metric_value(metrics_dict, metric_name, team_name):
     else:
         # 单个字符串，查找所有匹配并选择最优的
         all_matches = []
-        for key, metric_data in metrics_dict.items():
-            if metric_name in str(key) and team_name in metric_data:
+        for key in _matching_keys(metrics_dict, metric_name):
+            metric_data = metrics_dict[key]
+            if team_name in metric_data:
                 val = metric_data.get(team_name)
                 if val is not None:
                     # 应用相同的验证逻辑
-                    if '负债' in str(key) and val < 0 and '总计' not in str(key):
+                    if '负债' in key and val < 0 and '总计' not in key:
                         continue
-                    if ('EBITDA' in str(key) or '息税折旧' in str(key)) and abs(val) < 100:
+                    if ('EBITDA' in key or '息税折旧' in key) and abs(val) < 100:
                         continue
                     # 优先选择全局汇总表的数据
                     priority = 0
-                    if '全球' in str(key) or '总计' in str(key):
+                    if '全球' in key or '总计' in key:
                         priority = 2
-                    elif any(region in str(key) for region in ['美国', '亚洲', '欧洲', 'America', 'Asia', 'Europe']):
+                    elif any(region in key for region in ['美国', '亚洲', '欧洲', 'America', 'Asia', 'Europe']):
                         priority = 1
-                    all_matches.append((priority, val, str(key)))
+                    all_matches.append((priority, val, key))
         
         if all_matches:
             # 按优先级排序，优先返回全局汇总的值
@@ -320,6 +575,41 @@ def get_metric_value(metrics_dict, metric_name, team_name):
         return None
 
 
+# 标准指标名称 -> 优先级列表（只读，各脚本共用）
+# 优先匹配全局汇总值，避免匹配到区域性的值
+_METRIC_PRIORITIES = MappingProxyType({
+    '销售额': ('销售额合计', '本地销售额', '当地销售额', '销售额'),
+    '净利润': ('本回合利润', '税后利润', '净利润'),
+    '现金': ('现金及等价物', '现金 31.12.', '现金 1.1.', '现金'),
+    '短期贷款': ('短期贷款（无计划）', '短期贷款'),
+    '长期贷款': ('长期贷款',),
+    '负债合计': ('负债总计', '负债合计'),  # 优先使用负债总计（全局），避免匹配到区域性的负值
+    '总资产': ('总资产',),  # 优先匹配全局汇总的总资产（在"资产负债表, 千 USD, 全球"部分）
+    'EBITDA': ('息税折旧及摊销前利润(EBITDA)',),  # 优先匹配全局汇总的EBITDA
+})
+
+
+def get_metric_priority_list(metric_name):
+    """
+    根据标准指标名称返回优先级列表
+    用于指标提取时的优先级匹配
+    """
+    return _METRIC_PRIORITIES.get(metric_name, (metric_name,))
+
+
+def get_metric_with_priority(metrics_dict, metric_name, team):
+    """使用优先级列表获取指标值"""
+    priority_list = get_metric_priority_list(metric_name)
+    return get_metric_value(metrics_dict, priority_list, team)
+
+
+def format_k(value, prefix='$'):
+    """金额按千显示并取整，如 123456 -> '$123k'；缺失值（None）显示为N/A"""
+    if value is None:
+        return "N/A"
+    return f"{prefix}{int(round(value / 1000))}k"
+
+
 def print_structure_info(structure_info):
     """打印Excel结构信息"""
     print("=" * 80)